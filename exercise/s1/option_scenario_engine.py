@@ -0,0 +1,188 @@
+import numpy as np
+import pandas as pd
+from scipy.special import ndtr
+
+from exercise.s1.s_1_bs_option import Call, Option, Put
+
+"""
+Full revaluation of a book of Call/Put options (s_1_bs_option.py) on a grid of spot x volatility scenarios.
+
+Instead of creating a new Option object per option and per scenario, the book is stored as arrays (one entry per
+option) and broadcast against the grid: one Black-Scholes evaluation prices every option in every scenario. The
+options are processed by chunks so that the (spot scenarios x vol scenarios x options) arrays stay within a memory
+budget.
+"""
+
+GREEKS = ('delta', 'gamma', 'vega', 'theta', 'rho')
+
+
+def _normal_pdf(x: np.ndarray) -> np.ndarray:
+    return np.exp(-0.5 * x ** 2) / np.sqrt(2 * np.pi)
+
+
+def black_scholes(spot, strike, risk_free, ttm, vol, is_call, greeks: tuple = ()) -> dict[str, np.ndarray]:
+    """
+    Vectorized Black-Scholes price (and greeks) of European options, with the formulas of Call and Put. All the
+    parameters are arrays broadcast together.
+
+    Returns: A dictionary with the price and each greek asked.
+    """
+    sqrt_ttm = np.sqrt(ttm)
+    d1 = (np.log(spot / strike) + (risk_free + 0.5 * vol ** 2) * ttm) / (vol * sqrt_ttm)
+    d2 = d1 - vol * sqrt_ttm
+    discounted_strike = strike * np.exp(-risk_free * ttm)
+    sign = np.where(is_call, 1.0, -1.0)
+    # N(sign x d) gives N(d) for calls and N(-d) for puts
+    n_d1, n_d2 = ndtr(sign * d1), ndtr(sign * d2)
+    results = {'price': sign * (spot * n_d1 - discounted_strike * n_d2)}
+    if greeks:
+        pdf_d1 = _normal_pdf(d1)
+        formulas = {
+            'delta': lambda: sign * n_d1,
+            'gamma': lambda: pdf_d1 / (spot * vol * sqrt_ttm),
+            'vega': lambda: spot * pdf_d1 * sqrt_ttm,
+            'theta': lambda: -spot * vol * pdf_d1 / (2 * sqrt_ttm) - sign * risk_free * discounted_strike * n_d2,
+            'rho': lambda: sign * ttm * discounted_strike * n_d2,
+        }
+        results.update({greek: formulas[greek]() for greek in greeks})
+    return results
+
+
+class OptionBook:
+    """Options of a book as arrays: spot, strike, risk free rate, time to maturity, volatility, type and quantity."""
+
+    def __init__(self, options: list[Option], quantities: list[float] = None):
+        self.options = list(options)
+        self.spot = np.array([option.spot for option in options], dtype=np.float64)
+        self.strike = np.array([option.strike for option in options], dtype=np.float64)
+        self.risk_free = np.array([option.risk_free for option in options], dtype=np.float64)
+        self.ttm = np.array([option.ttm for option in options], dtype=np.float64)
+        self.vol = np.array([option.vol for option in options], dtype=np.float64)
+        self.is_call = np.array([self._is_call(option) for option in options], dtype=bool)
+        self.quantities = np.ones(len(options)) if quantities is None else np.asarray(quantities, dtype=np.float64)
+
+    @staticmethod
+    def _is_call(option: Option) -> bool:
+        if isinstance(option, Call):
+            return True
+        if isinstance(option, Put):
+            return False
+        # Call/Put classes of the other exercises (e.g. s5_decorators) have the same attributes
+        if type(option).__name__ in ('Call', 'Put'):
+            return type(option).__name__ == 'Call'
+        raise TypeError(f"{type(option).__name__} is neither a Call nor a Put.")
+
+    def __len__(self):
+        return len(self.options)
+
+    def prices(self) -> np.ndarray:
+        return black_scholes(self.spot, self.strike, self.risk_free, self.ttm, self.vol, self.is_call)['price']
+
+
+class OptionScenarioEngine:
+    """
+    Scenario grid of relative spot shocks (0.1 for +10%) and absolute volatility shocks (0.05 for +5 vol points),
+    applied to every option of the book.
+
+    - pnl_cube: P&L of each position in each scenario, array (spot shocks, vol shocks, options), by chunks of options
+      with iter_pnl_cube for books whose cube does not fit in memory;
+    - pnl_ladder: P&L of the whole book for each scenario, accumulated chunk by chunk;
+    - greek_ladder: greek of the whole book (sum of quantity x greek) for each scenario.
+
+    max_chunk_bytes bounds the size of the arrays of one chunk (each chunk holds about 16 arrays of the grid size).
+    """
+
+    def __init__(self, book: OptionBook, spot_shocks: np.ndarray, vol_shocks: np.ndarray,
+                 max_chunk_bytes: int = 256 * 2 ** 20, min_vol: float = 1e-4):
+        self.book = book
+        self.spot_shocks = np.asarray(spot_shocks, dtype=np.float64)
+        self.vol_shocks = np.asarray(vol_shocks, dtype=np.float64)
+        self.min_vol = min_vol
+        grid_size = len(self.spot_shocks) * len(self.vol_shocks)
+        self.chunk_size = max(1, max_chunk_bytes // (16 * 8 * grid_size))
+        self._base_prices: np.ndarray | None = None
+
+    @property
+    def base_prices(self) -> np.ndarray:
+        if self._base_prices is None:
+            self._base_prices = self.book.prices()
+        return self._base_prices
+
+    def _revalue(self, start: int, end: int, greeks: tuple = ()) -> dict[str, np.ndarray]:
+        """Prices (and greeks) of the options start to end in every scenario, arrays (spot, vol, options)."""
+        book = self.book
+        spot = book.spot[start:end] * (1 + self.spot_shocks[:, None, None])
+        vol = np.maximum(book.vol[start:end] + self.vol_shocks[None, :, None], self.min_vol)
+        return black_scholes(spot, book.strike[start:end], book.risk_free[start:end], book.ttm[start:end], vol,
+                             book.is_call[start:end], greeks)
+
+    def iter_pnl_cube(self):
+        """Yields (first option, P&L cube of the chunk of options) chunk by chunk."""
+        for start in range(0, len(self.book), self.chunk_size):
+            end = min(start + self.chunk_size, len(self.book))
+            prices = self._revalue(start, end)['price']
+            yield start, (prices - self.base_prices[start:end]) * self.book.quantities[start:end]
+
+    def pnl_cube(self) -> np.ndarray:
+        cube = np.empty((len(self.spot_shocks), len(self.vol_shocks), len(self.book)))
+        for start, chunk in self.iter_pnl_cube():
+            cube[:, :, start:start + chunk.shape[2]] = chunk
+        return cube
+
+    def pnl_ladder(self) -> pd.DataFrame:
+        ladder = np.zeros((len(self.spot_shocks), len(self.vol_shocks)))
+        for _, chunk in self.iter_pnl_cube():
+            ladder += chunk.sum(axis=2)
+        return self._to_dataframe(ladder)
+
+    def greek_ladder(self, greeks: tuple = GREEKS) -> dict[str, pd.DataFrame]:
+        ladders = {greek: np.zeros((len(self.spot_shocks), len(self.vol_shocks))) for greek in greeks}
+        for start in range(0, len(self.book), self.chunk_size):
+            end = min(start + self.chunk_size, len(self.book))
+            results = self._revalue(start, end, tuple(greeks))
+            for greek in greeks:
+                ladders[greek] += results[greek] @ self.book.quantities[start:end]
+        return {greek: self._to_dataframe(ladder) for greek, ladder in ladders.items()}
+
+    def _to_dataframe(self, ladder: np.ndarray) -> pd.DataFrame:
+        return pd.DataFrame(ladder, index=pd.Index(self.spot_shocks, name='spot shock'),
+                            columns=pd.Index(self.vol_shocks, name='vol shock'))
+
+
+if __name__ == '__main__':
+    import time
+
+    spot_shocks = np.linspace(-0.3, 0.3, 25)
+    vol_shocks = np.linspace(-0.1, 0.1, 11)
+
+    # check against the Call/Put objects, rebuilt for each scenario
+    small_book = [Call(200, 250, 0.05, 1, 0.15), Put(200, 180, 0.05, 0.5, 0.25), Call(100, 95, 0.03, 0.25, 0.3)]
+    engine = OptionScenarioEngine(OptionBook(small_book, [10, -5, 3]), spot_shocks, vol_shocks)
+    cube = engine.pnl_cube()
+    max_difference = 0.0
+    for i, spot_shock in enumerate(spot_shocks):
+        for j, vol_shock in enumerate(vol_shocks):
+            for k, (option, quantity) in enumerate(zip(small_book, [10, -5, 3])):
+                shocked = type(option)(option.spot * (1 + spot_shock), option.strike, option.risk_free, option.ttm,
+                                       option.vol + vol_shock)
+                expected = quantity * (shocked.compute_price() - option.compute_price())
+                max_difference = max(max_difference, abs(cube[i, j, k] - expected))
+    print(f"max difference with the Call/Put objects: {max_difference:.2e}")
+    print(engine.greek_ladder(('delta',))['delta'].iloc[::6, ::5].round(2))
+
+    # 20,000 options x 275 scenarios, full revaluation with greeks
+    n_options = 20_000
+    rng = np.random.default_rng(0)
+    options = [(Call if is_call else Put)(spot, spot * moneyness, 0.03, ttm, vol) for is_call, spot, moneyness, ttm, vol
+               in zip(rng.random(n_options) < 0.5, rng.uniform(50, 500, n_options), rng.uniform(0.7, 1.3, n_options),
+                      rng.uniform(0.05, 2.0, n_options), rng.uniform(0.1, 0.6, n_options))]
+    engine = OptionScenarioEngine(OptionBook(options, rng.integers(-100, 100, n_options)), spot_shocks, vol_shocks,
+                                  max_chunk_bytes=64 * 2 ** 20)
+    start = time.perf_counter()
+    ladder = engine.pnl_ladder()
+    pnl_time = time.perf_counter() - start
+    start = time.perf_counter()
+    engine.greek_ladder()
+    greek_time = time.perf_counter() - start
+    print(f"{n_options} options x {ladder.size} scenarios ({engine.chunk_size} options per chunk): "
+          f"P&L ladder {pnl_time:.2f}s, greek ladders {greek_time:.2f}s")
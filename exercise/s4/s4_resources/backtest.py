@@ -0,0 +1,193 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from exercise.s4.s4_resources.portfolio import Portfolio
+from exercise.s4.s4_resources.price_panel import PricePanel
+from exercise.s4.s4_resources.quote import Quote
+from exercise.s4.s4_resources.quote_store import QuoteStore
+
+
+class RebalancingCalendar:
+    """
+    Dates on which the portfolio is rebalanced:
+    - a pandas period code ('D', 'W', 'M', 'Q', 'Y'): first trading date of each period
+    - an integer n: every n trading dates
+    - a list of dates: first trading date on or after each of them
+    """
+
+    def __init__(self, frequency: str | int | list[datetime] = 'M'):
+        self.frequency = frequency
+
+    def rebalancing_mask(self, timestamps: np.ndarray) -> np.ndarray:
+        mask = np.zeros(len(timestamps), dtype=bool)
+        if len(timestamps) == 0:
+            return mask
+        if isinstance(self.frequency, int):
+            mask[::self.frequency] = True
+        elif isinstance(self.frequency, str):
+            periods = pd.DatetimeIndex(timestamps.view('datetime64[ns]')).to_period(self.frequency).asi8
+            mask[0] = True
+            mask[1:] = periods[1:] != periods[:-1]
+        else:
+            dates = pd.DatetimeIndex(self.frequency).as_unit('ns').asi8
+            rows = np.searchsorted(timestamps, dates, side='left')
+            mask[rows[rows < len(timestamps)]] = True
+        return mask
+
+
+@dataclass
+class BacktestResult:
+    dates: pd.DatetimeIndex
+    nav: np.ndarray
+    rebalancing_dates: pd.DatetimeIndex
+
+    def nav_series(self) -> pd.Series:
+        return pd.Series(self.nav, index=self.dates, name='NAV')
+
+
+class _BarCursor:
+    """Current bar of a backtest, shared by the quotes and quote stores of all the instruments."""
+
+    def __init__(self, timestamps: np.ndarray, prices_by_instrument: np.ndarray):
+        self.timestamps = timestamps
+        self.prices_by_instrument = prices_by_instrument
+        self.row = -1
+        self.date: datetime | None = None
+        self.bar_prices: list[float] = []
+
+    def move_to(self, row: int):
+        self.row = row
+        self.date = pd.Timestamp(self.timestamps[row]).to_pydatetime()
+        self.bar_prices = self.prices_by_instrument[:, row].tolist()
+
+
+class _BarQuote(Quote):
+    """Last quote of an instrument: the price of its column of the panel on the current bar."""
+
+    def __init__(self, column: int, cursor: _BarCursor):
+        self._column = column
+        self._cursor = cursor
+
+    @property
+    def date(self) -> datetime:
+        return self._cursor.date
+
+    @property
+    def price(self) -> float:
+        return self._cursor.bar_prices[self._column]
+
+
+class _BarQuoteStore(QuoteStore):
+    """Quote history of an instrument: views of its column of the panel ending on the current bar."""
+
+    def __init__(self, timestamps: np.ndarray, prices: np.ndarray, cursor: _BarCursor):
+        self._all_timestamps = timestamps
+        self._all_prices = prices
+        self._cursor = cursor
+
+    @property
+    def timestamps(self) -> np.ndarray:
+        return self._all_timestamps[:self._cursor.row + 1]
+
+    @property
+    def prices(self) -> np.ndarray:
+        return self._all_prices[:self._cursor.row + 1]
+
+
+class BacktestEngine:
+    """
+    Event-driven backtest of a Portfolio over the history of its instruments.
+
+    The aligned bars of all the instruments are read from a PricePanel in date order. During the run, the last quote
+    and the quote history of each instrument are views of its column of the panel ending on the current bar (so the
+    strategy cannot look ahead), attached once: moving to the next rebalancing date only moves the bar they share
+    before Portfolio.rebalance_portfolio is called. The quotes and histories of the instruments are restored at the
+    end of the run. Between two rebalancing dates the quantities are constant, and the NAV
+    of the whole segment is computed with one matrix product into a preallocated array.
+
+    The portfolio is fully reinvested: its aum is set to the current NAV before each rebalancing, and the part of the
+    NAV that cannot be invested (quantities are rounded down) is kept as cash. The execution costs of each rebalancing
+    (Portfolio.execution_cost_model) are paid from the cash.
+    """
+
+    def __init__(self, portfolio: Portfolio, price_panel: PricePanel = None,
+                 rebalancing_calendar: RebalancingCalendar = None):
+        self.portfolio = portfolio
+        if price_panel is None:
+            price_panel = PricePanel.from_instruments([position.instrument for position in portfolio.positions])
+        self.price_panel = price_panel
+        self.rebalancing_calendar = rebalancing_calendar if rebalancing_calendar is not None else RebalancingCalendar()
+
+    def run(self, start_date: datetime = None, end_date: datetime = None) -> BacktestResult:
+        panel = self.price_panel
+        positions = self.portfolio.positions
+        instruments = [position.instrument for position in positions]
+        columns = np.array([panel.ticker_index[instrument.ticker] for instrument in instruments], dtype=np.int64)
+
+        start_row = panel.first_complete_row()
+        if start_date is not None:
+            start_row = max(start_row, int(np.searchsorted(panel.timestamps, QuoteStore.to_timestamp(start_date))))
+        end_row = len(panel)
+        if end_date is not None:
+            end_row = int(np.searchsorted(panel.timestamps, QuoteStore.to_timestamp(end_date), side='right'))
+        if start_row >= end_row:
+            raise ValueError("No date to backtest between start_date and end_date.")
+
+        timestamps = panel.timestamps
+        prices = panel.prices[:, columns]  # dates x positions, used for NAV computation
+        prices_by_instrument = np.ascontiguousarray(prices.T)  # positions x dates, used for history views
+
+        rebalancing_mask = self.rebalancing_calendar.rebalancing_mask(timestamps[start_row:end_row])
+        rebalancing_mask[0] = True  # the portfolio is invested on the first date
+        rebalancing_rows = np.flatnonzero(rebalancing_mask) + start_row
+
+        saved_states = [self._instrument_state(instrument) for instrument in instruments]
+        cursor = _BarCursor(timestamps, prices_by_instrument)
+        for column, instrument in enumerate(instruments):
+            instrument.last_quote = _BarQuote(column, cursor)
+            instrument.attach_quote_store(_BarQuoteStore(timestamps, prices_by_instrument[column], cursor))
+
+        nav = np.empty(end_row - start_row, dtype=np.float64)
+        quantities = np.zeros(len(positions), dtype=np.float64)
+        cash = self.portfolio.aum
+        segment_start = start_row
+        try:
+            for row in rebalancing_rows:
+                nav[segment_start - start_row:row - start_row] = cash + prices[segment_start:row] @ quantities
+                current_nav = cash + prices[row] @ quantities
+
+                cursor.move_to(row)
+                self.portfolio.aum = current_nav
+                self.portfolio.rebalance_portfolio(cursor.date)
+
+                if self.portfolio.state is not None:
+                    quantities = self.portfolio.state.quantities.copy()
+                else:
+                    quantities = np.array([position.quantity for position in positions], dtype=np.float64)
+                cash = current_nav - prices[row] @ quantities - self.portfolio.last_rebalancing_cost
+                segment_start = row
+        finally:
+            for instrument, saved_state in zip(instruments, saved_states):
+                self._restore_instrument_state(instrument, saved_state)
+        nav[segment_start - start_row:] = cash + prices[segment_start:end_row] @ quantities
+
+        dates = panel.dates[start_row:end_row]
+        self.portfolio.nav = nav[-1]
+        self.portfolio.aum = nav[-1]
+        self.portfolio.historical_nav = [Quote(date, value) for date, value in
+                                         zip(dates.to_pydatetime().tolist(), nav.tolist())]
+        return BacktestResult(dates, nav, panel.dates[rebalancing_rows])
+
+    # attributes of an instrument replaced during the run (quote_store is cached in __dict__ by its LazyProperty)
+    _INSTRUMENT_ATTRIBUTES = ('last_quote', 'quote_history', '_history_source', 'quote_store')
+
+    def _instrument_state(self, instrument) -> dict:
+        return {name: instrument.__dict__[name] for name in self._INSTRUMENT_ATTRIBUTES if name in instrument.__dict__}
+
+    def _restore_instrument_state(self, instrument, saved_state: dict):
+        for name in self._INSTRUMENT_ATTRIBUTES:
+            instrument.__dict__.pop(name, None)
+        instrument.__dict__.update(saved_state)
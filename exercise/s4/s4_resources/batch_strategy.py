@@ -0,0 +1,144 @@
+from abc import abstractmethod
+
+import numpy as np
+
+from exercise.s4.s4_resources.price_panel import PricePanel
+from exercise.s4.s4_resources.strategy import Strategy, EqualWeightStrategy, MomentumStrategy, \
+    buy_sell_signals_to_weights
+
+
+class BatchStrategy(Strategy):
+    """
+    Strategy generating the signals of the whole universe at once from a price matrix of shape (dates, tickers) and a
+    ticker index (ticker -> column of the matrix), instead of looping over a dictionary of positions.
+
+    generate_signals, the dictionary API of Strategy, is implemented on top of it: the last `required_history` quotes of
+    every instrument are aligned in a matrix, and the signal vector is converted back to a dictionary. A batch strategy
+    can therefore be used wherever a Strategy is expected.
+    """
+    required_history: int | None = None  # number of dates needed to compute the last signals, None for all
+
+    @abstractmethod
+    def generate_signal_matrix(self, prices: np.ndarray, ticker_index: dict[str, int]) -> np.ndarray:
+        """
+        Parameters:
+        - prices: matrix of shape (dates, tickers). The signals of row t only use the rows 0 to t.
+        - ticker_index: dictionary with tickers as keys and columns of prices as values.
+
+        Returns:
+        - Matrix of shape (dates, tickers) with the signal of each ticker on each date.
+        """
+        pass
+
+    def generate_signal_vector(self, prices: np.ndarray, ticker_index: dict[str, int]) -> np.ndarray:
+        """Signals of the last date only. Only the last required_history rows of prices are used."""
+        if self.required_history is not None:
+            prices = prices[-self.required_history:]
+        return self.generate_signal_matrix(prices, ticker_index)[-1]
+
+    def generate_weight_matrix(self, prices: np.ndarray) -> np.ndarray:
+        ticker_index = {column: column for column in range(prices.shape[1])}
+        weights, mask = self.transform_signals_to_weights(self.generate_signal_matrix(prices, ticker_index))
+        return np.where(mask, weights, np.nan)
+
+    def generate_signals(self, data_for_signal_generation: dict):
+        stores = {}
+        for ticker, position in data_for_signal_generation.items():
+            instrument = position.instrument
+            if self.required_history is not None:
+                stores[ticker] = instrument.history_tail(self.required_history)
+            else:
+                stores[ticker] = instrument.history_window()
+        panel = PricePanel.from_stores(stores)
+        signals = self.generate_signal_vector(panel.prices, panel.ticker_index)
+        return {ticker: signals[column].item() for ticker, column in panel.ticker_index.items()}
+
+
+class BatchEqualWeightStrategy(BatchStrategy, EqualWeightStrategy):
+    required_history = 1
+
+    def generate_signal_matrix(self, prices: np.ndarray, ticker_index: dict[str, int]) -> np.ndarray:
+        return np.full(prices.shape, 1 / prices.shape[1])
+
+
+class BatchMomentumStrategy(BatchStrategy, MomentumStrategy):
+
+    def __init__(self, lookback_period: int):
+        super().__init__(lookback_period)
+        self.required_history = lookback_period
+
+    def generate_signal_matrix(self, prices: np.ndarray, ticker_index: dict[str, int]) -> np.ndarray:
+        return self._signal_matrix(prices)
+
+
+class BatchMeanReversionStrategy(BatchStrategy):
+    """
+    Mean reversion signals of MeanReversionStrategy (theory/all_classes_extended_version.py) for a whole universe:
+    buy (1) when the price is below the mean of the previous mean_reversion_window prices, sell (-1) when it is above,
+    0 when they are equal or when the window is not complete yet.
+    """
+
+    def __init__(self, mean_reversion_window: int):
+        self.mean_reversion_window = mean_reversion_window
+        self.required_history = mean_reversion_window + 1
+
+    def generate_signal_matrix(self, prices: np.ndarray, ticker_index: dict[str, int]) -> np.ndarray:
+        window = self.mean_reversion_window
+        is_valid = ~np.isnan(prices)
+        zeros = np.zeros((1, prices.shape[1]))
+        cumulative_sum = np.concatenate([zeros, np.cumsum(np.where(is_valid, prices, 0.0), axis=0)])
+        cumulative_count = np.concatenate([zeros, np.cumsum(is_valid, axis=0)])
+
+        # mean of the rows t - window to t - 1 for each row t
+        mean_price = np.full(prices.shape, np.nan)
+        window_sum = cumulative_sum[window:-1] - cumulative_sum[:-window - 1]
+        window_count = cumulative_count[window:-1] - cumulative_count[:-window - 1]
+        mean_price[window:] = np.where(window_count == window, window_sum / window, np.nan)
+        deviation = mean_price - prices
+        return np.where(np.isnan(deviation), 0, np.sign(deviation)).astype(np.int64)
+
+    def transform_signals_to_weights(self, signals: np.ndarray) -> (np.ndarray, np.ndarray):
+        return buy_sell_signals_to_weights(signals)
+
+
+if __name__ == '__main__':
+    # Benchmark at 5,000 tickers: batch signals against the dictionary API of MomentumStrategy
+    import time
+
+    import pandas as pd
+
+    from exercise.s4.s4_resources.instrument import Instrument
+    from exercise.s4.s4_resources.position import Position
+    from exercise.s4.s4_resources.quote import Quote
+
+    n_dates, n_tickers, lookback_period = 252, 5000, 20
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2023-01-02', periods=n_dates)
+    tickers = [f'TICKER_{i}' for i in range(n_tickers)]
+    price_matrix = 100 * np.exp(np.cumsum(rng.normal(0, 0.01, (n_dates, n_tickers)), axis=0))
+    ticker_index = {ticker: column for column, ticker in enumerate(tickers)}
+
+    positions = {}
+    for ticker, column in ticker_index.items():
+        instrument = Instrument(ticker, 'XPAR', Quote(dates[-1], price_matrix[-1, column]), 'USD')
+        instrument.populate_quote_history_from_df(pd.DataFrame({'Close': price_matrix[:, column]}, index=dates))
+        positions[ticker] = Position(instrument)
+
+    start = time.time()
+    BatchMomentumStrategy(lookback_period).generate_signal_matrix(price_matrix, ticker_index)
+    print(f"signal matrix ({n_dates} dates x {n_tickers} tickers): {time.time() - start:.4f}s")
+
+    start = time.time()
+    BatchMomentumStrategy(lookback_period).generate_signal_vector(price_matrix, ticker_index)
+    print(f"signal vector (last date, {n_tickers} tickers): {time.time() - start:.4f}s")
+
+    start = time.time()
+    batch_signals = BatchMomentumStrategy(lookback_period).generate_signals(positions)
+    print(f"batch strategy through the dictionary API: {time.time() - start:.4f}s")
+
+    sample = dict(list(positions.items())[:250])
+    start = time.time()
+    loop_signals = MomentumStrategy(lookback_period).generate_signals(sample)
+    loop_time = (time.time() - start) * n_tickers / len(sample)
+    print(f"MomentumStrategy dictionary loop (extrapolated from {len(sample)} tickers): {loop_time:.2f}s")
+    print(f"same signals: {all(batch_signals[ticker] == signal for ticker, signal in loop_signals.items())}")
@@ -0,0 +1,242 @@
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+from exercise.s4.s4_resources.financial_asset_util import TRADING_DAYS
+from exercise.s4.s4_resources.price_panel import PricePanel
+from exercise.s4.s4_resources.quote_store import QuoteStore
+
+
+class CovarianceEstimator(ABC):
+    """Estimator of the covariance matrix of the returns of a universe (one-period returns, not annualized)."""
+
+    @abstractmethod
+    def estimate(self, returns: np.ndarray) -> np.ndarray:
+        """
+        Parameters:
+        - returns: matrix of shape (dates, tickers) without NaN, oldest date first.
+
+        Returns:
+        - Covariance matrix of shape (tickers, tickers).
+        """
+        pass
+
+
+class SampleCovariance(CovarianceEstimator):
+    def estimate(self, returns: np.ndarray) -> np.ndarray:
+        deviations = returns - returns.mean(axis=0)
+        return deviations.T @ deviations / (len(returns) - 1)
+
+
+class LedoitWolfCovariance(CovarianceEstimator):
+    """
+    Ledoit-Wolf shrinkage of the sample covariance towards a scaled identity matrix, with the optimal shrinkage
+    intensity of Ledoit and Wolf (2004). Well conditioned even with more tickers than dates.
+    """
+
+    def __init__(self):
+        self.last_shrinkage: float | None = None
+
+    def estimate(self, returns: np.ndarray) -> np.ndarray:
+        n_dates, n_tickers = returns.shape
+        deviations = returns - returns.mean(axis=0)
+        sample_covariance = deviations.T @ deviations / n_dates
+        mu = np.trace(sample_covariance) / n_tickers
+
+        squared_deviations = deviations ** 2
+        # distance of the sample covariance to the target, and variance of the sample covariance around its mean
+        delta = (np.sum(sample_covariance ** 2) - 2 * mu * np.trace(sample_covariance) + n_tickers * mu ** 2)
+        beta = (np.sum(squared_deviations.T @ squared_deviations) / n_dates - np.sum(sample_covariance ** 2)) / n_dates
+        beta = min(beta, delta)
+        shrinkage = 0.0 if beta == 0 else beta / delta
+        self.last_shrinkage = shrinkage
+
+        covariance = (1 - shrinkage) * sample_covariance
+        covariance[np.diag_indices(n_tickers)] += shrinkage * mu
+        return covariance
+
+
+class EwmaCovariance(CovarianceEstimator):
+    """
+    Exponentially weighted covariance (RiskMetrics, zero mean): the weight of the return of t dates ago is decay^t,
+    normalized by the sum of the weights.
+    """
+
+    def __init__(self, decay: float = 0.94):
+        self.decay = decay
+
+    def estimate(self, returns: np.ndarray) -> np.ndarray:
+        weights = self.decay ** np.arange(len(returns) - 1, -1, -1)
+        return (returns * (weights / weights.sum())[:, None]).T @ returns
+
+    def new_state(self, n_tickers: int):
+        return EwmaCovarianceState(self.decay, n_tickers)
+
+
+class EwmaCovarianceState:
+    """
+    Running EWMA covariance updated with each new bar in O(tickers²) instead of recomputing it from the history: the
+    weighted sum of the outer products of the returns and the sum of the weights are both decayed, then increased by
+    the new bar. Gives exactly EwmaCovariance.estimate of all the returns added so far.
+    """
+    __slots__ = ('decay', 'weighted_sum', 'weight_sum', 'last_row')
+
+    def __init__(self, decay: float, n_tickers: int):
+        self.decay = decay
+        self.weighted_sum = np.zeros((n_tickers, n_tickers))
+        self.weight_sum = 0.0
+        self.last_row = -1
+
+    def update(self, returns: np.ndarray):
+        """Adds the returns of one bar (vector) or of several bars (matrix, oldest first)."""
+        returns = np.atleast_2d(returns)
+        weights = self.decay ** np.arange(len(returns) - 1, -1, -1)
+        self.weighted_sum *= self.decay ** len(returns)
+        self.weighted_sum += (returns * weights[:, None]).T @ returns
+        self.weight_sum = self.weight_sum * self.decay ** len(returns) + weights.sum()
+
+    def covariance(self) -> np.ndarray:
+        return self.weighted_sum / self.weight_sum
+
+
+class CovarianceService:
+    """
+    Covariance and correlation matrices of any universe of the tickers of a price panel, as of any date, over the
+    `window` returns ending on that date.
+
+    The matrices are cached by (universe, window, as-of date) with a least recently used eviction, so that the
+    strategies and the portfolio asking for the risk of the same universe on the same rebalancing date share one
+    estimation. The returned matrices are read-only.
+
+    With an EwmaCovariance estimator, each universe keeps a running EwmaCovarianceState that is moved forward with the
+    new bars since its last date instead of being estimated again from the window (the state starts on the first
+    window asked; older returns have negligible weights after a few hundred bars).
+    """
+
+    def __init__(self, price_panel: PricePanel, estimator: CovarianceEstimator = None, window: int = 252,
+                 max_cache_entries: int = 128):
+        self.price_panel = price_panel
+        self.estimator = estimator if estimator is not None else LedoitWolfCovariance()
+        self.window = window
+        self.max_cache_entries = max_cache_entries
+        self._returns: np.ndarray | None = None
+        self._cache: OrderedDict = OrderedDict()
+        self._ewma_states: dict[tuple, EwmaCovarianceState] = {}
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    @property
+    def returns(self) -> np.ndarray:
+        """One-period returns of the whole panel, computed once. Row t is the return from date t - 1 to date t."""
+        if self._returns is None:
+            prices = self.price_panel.prices
+            self._returns = np.full(prices.shape, np.nan)
+            self._returns[1:] = prices[1:] / prices[:-1] - 1
+        return self._returns
+
+    def as_of_row(self, as_of: datetime = None) -> int:
+        if as_of is None:
+            return len(self.price_panel) - 1
+        row = int(np.searchsorted(self.price_panel.timestamps, QuoteStore.to_timestamp(as_of), side='right')) - 1
+        if row < 1:
+            raise ValueError("No return on or before the as-of date.")
+        return row
+
+    def covariance(self, tickers: list[str] = None, as_of: datetime = None, window: int = None) -> np.ndarray:
+        """Covariance matrix of the one-period returns of tickers (all the panel by default), in the order given."""
+        return self.covariance_at_row(tickers, self.as_of_row(as_of), window)
+
+    def covariance_at_row(self, tickers: list[str] = None, row: int = None, window: int = None) -> np.ndarray:
+        """Same as covariance, as of a row of the price panel (the last one by default)."""
+        universe = tuple(self.price_panel.tickers if tickers is None else tickers)
+        window = self.window if window is None else window
+        row = len(self.price_panel) - 1 if row is None else row
+        key = (universe, window, int(self.price_panel.timestamps[row]))
+        if key in self._cache:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.cache_misses += 1
+        columns = np.array([self.price_panel.ticker_index[ticker] for ticker in universe], dtype=np.int64)
+        if isinstance(self.estimator, EwmaCovariance):
+            covariance = self._ewma_covariance(universe, columns, window, row)
+        else:
+            covariance = self.estimator.estimate(self.window_returns(columns, window, row))
+        covariance.flags.writeable = False
+        self._cache[key] = covariance
+        if len(self._cache) > self.max_cache_entries:
+            self._cache.popitem(last=False)
+        return covariance
+
+    def mean_returns_at_row(self, tickers: list[str] = None, row: int = None, window: int = None) -> np.ndarray:
+        """Mean one-period return of each ticker over the window ending on a row (the last one by default)."""
+        tickers = self.price_panel.tickers if tickers is None else tickers
+        columns = np.array([self.price_panel.ticker_index[ticker] for ticker in tickers], dtype=np.int64)
+        row = len(self.price_panel) - 1 if row is None else row
+        return self.window_returns(columns, self.window if window is None else window, row).mean(axis=0)
+
+    def correlation(self, tickers: list[str] = None, as_of: datetime = None, window: int = None) -> np.ndarray:
+        covariance = self.covariance(tickers, as_of, window)
+        volatility = np.sqrt(np.diag(covariance))
+        return covariance / np.outer(volatility, volatility)
+
+    def portfolio_volatility(self, weights: np.ndarray, tickers: list[str] = None, as_of: datetime = None,
+                             window: int = None, periods_per_year: int = TRADING_DAYS) -> float:
+        """Annualized volatility of a portfolio with the given weights (in the order of tickers)."""
+        weights = np.asarray(weights, dtype=np.float64)
+        return float(np.sqrt(weights @ self.covariance(tickers, as_of, window) @ weights * periods_per_year))
+
+    def window_returns(self, columns: np.ndarray, window: int, row: int) -> np.ndarray:
+        """Last `window` returns ending on row, keeping the dates on which every ticker of the universe has a return."""
+        returns = self.returns[max(row - window + 1, 1):row + 1, columns]
+        return returns[~np.isnan(returns).any(axis=1)]
+
+    def _ewma_covariance(self, universe: tuple, columns: np.ndarray, window: int, row: int) -> np.ndarray:
+        state = self._ewma_states.get((universe, window))
+        if state is None or state.last_row > row:
+            state = self.estimator.new_state(len(columns))
+            state.last_row = max(row - window, 0)
+            self._ewma_states[(universe, window)] = state
+        new_returns = self.returns[state.last_row + 1:row + 1, columns]
+        new_returns = new_returns[~np.isnan(new_returns).any(axis=1)]
+        if len(new_returns):
+            state.update(new_returns)
+        state.last_row = row
+        return state.covariance()
+
+
+if __name__ == '__main__':
+    import time
+
+    import pandas as pd
+
+    n_dates, n_tickers = 2520, 500
+    rng = np.random.default_rng(0)
+    factor_returns = rng.normal(0, 0.01, (n_dates, 5))
+    returns = factor_returns @ rng.normal(0.5, 0.3, (5, n_tickers)) + rng.normal(0, 0.01, (n_dates, n_tickers))
+    dates = pd.bdate_range('2014-01-01', periods=n_dates)
+    price_panel = PricePanel.from_dataframe(pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=dates,
+                                                         columns=[f'TICKER_{i}' for i in range(n_tickers)]))
+    rebalancing_dates = dates[252::21]
+
+    for estimator in [SampleCovariance(), LedoitWolfCovariance(), EwmaCovariance()]:
+        service = CovarianceService(price_panel, estimator)
+        start = time.perf_counter()
+        for date in rebalancing_dates:
+            service.covariance(as_of=date)
+        first_pass = time.perf_counter() - start
+        start = time.perf_counter()
+        for date in rebalancing_dates:
+            service.covariance(as_of=date)
+        second_pass = time.perf_counter() - start
+        condition_number = np.linalg.cond(service.covariance(as_of=rebalancing_dates[-1]))
+        print(f"{type(estimator).__name__}: {len(rebalancing_dates)} rebalancings x {n_tickers} tickers "
+              f"{first_pass:.3f}s, cached {second_pass:.4f}s, condition number {condition_number:.0f}")
+
+    ewma = EwmaCovariance()
+    incremental = CovarianceService(price_panel, ewma).covariance(as_of=dates[1000])
+    direct = ewma.estimate(np.diff(price_panel.prices[1000 - 252:1001], axis=0) / price_panel.prices[1000 - 252:1000])
+    print(f"incremental EWMA against direct estimation: max difference {np.max(np.abs(incremental - direct)):.2e}")
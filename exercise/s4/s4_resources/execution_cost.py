@@ -0,0 +1,76 @@
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+
+
+@dataclass
+class Trade:
+    date: datetime
+    ticker: str
+    quantity: float
+    price: float
+    cost: float
+
+
+class ExecutionCostModel(ABC):
+    """
+    Cost of executing trades. Every method works on arrays so that the cost of all the trades of a rebalancing (or of
+    all the rebalancings of a vectorized backtest) is computed at once.
+    """
+
+    @abstractmethod
+    def compute_costs(self, traded_notional: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        """
+        Parameters:
+        - traded_notional: absolute traded amounts (quantity x price), one per ticker (1-D) or per date and ticker (2-D).
+        - prices: execution prices, same shape as traded_notional.
+
+        Returns:
+        - Cost of each trade in the portfolio currency, same shape as traded_notional.
+        """
+        pass
+
+
+class NoExecutionCost(ExecutionCostModel):
+    def compute_costs(self, traded_notional: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        return np.zeros_like(traded_notional, dtype=np.float64)
+
+
+class FixedBpsCost(ExecutionCostModel):
+    """Cost proportional to the traded amount (fees, taxes...)."""
+
+    def __init__(self, bps: float):
+        self.bps = bps
+
+    def compute_costs(self, traded_notional: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        return traded_notional * self.bps / 10_000
+
+
+class SpreadCost(ExecutionCostModel):
+    """Half of the bid-ask spread paid on each trade. spread_bps is a number or an array with one spread per ticker."""
+
+    def __init__(self, spread_bps: float | np.ndarray):
+        self.spread_bps = np.asarray(spread_bps, dtype=np.float64)
+
+    def compute_costs(self, traded_notional: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        return traded_notional * self.spread_bps / 2 / 10_000
+
+
+class SquareRootMarketImpactCost(ExecutionCostModel):
+    """
+    Square-root market impact: the price moves by coefficient x daily volatility x sqrt(traded quantity / average
+    daily volume), so the cost of a trade grows with the power 1.5 of its size. daily_volatility and
+    average_daily_volume are numbers or arrays with one value per ticker.
+    """
+
+    def __init__(self, daily_volatility: float | np.ndarray, average_daily_volume: float | np.ndarray,
+                 coefficient: float = 1.0):
+        self.daily_volatility = np.asarray(daily_volatility, dtype=np.float64)
+        self.average_daily_volume = np.asarray(average_daily_volume, dtype=np.float64)
+        self.coefficient = coefficient
+
+    def compute_costs(self, traded_notional: np.ndarray, prices: np.ndarray) -> np.ndarray:
+        participation = traded_notional / (prices * self.average_daily_volume)
+        return self.coefficient * self.daily_volatility * np.sqrt(participation) * traded_notional
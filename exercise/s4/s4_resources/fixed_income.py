@@ -0,0 +1,212 @@
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+"""
+Batch analytics of fixed rate bonds: cashflow schedules, yield to maturity, price, duration, convexity and DV01.
+
+A bond is any object with `face_value` and `maturity_date`, with optional `coupon_rate` (annual, 0 for a zero coupon
+bond) and `frequency` (coupons per year, 2 by default). Prices are clean prices per 100 of face value, yields are
+compounded at the coupon frequency.
+
+The schedules of all the bonds are generated at once as padded matrices (bonds x coupon dates) and kept by settlement
+date, so a new set of prices only runs the Newton iterations, one array operation per iteration for the whole list.
+"""
+
+
+def _to_day(value) -> np.datetime64:
+    return np.datetime64(pd.Timestamp(value).date(), 'D')
+
+
+class BondSchedule:
+    """
+    Remaining cashflows of a list of bonds as of a settlement date, as matrices (bonds x coupon dates) padded with zero
+    amounts:
+    - periods: time of each cashflow in coupon periods from the settlement date (fractional for the first one);
+    - amounts: coupon (and redemption on the maturity date) per 100 of face value;
+    - accrued: accrued interest of each bond per 100 of face value.
+    """
+
+    def __init__(self, maturities: np.ndarray, coupon_rates: np.ndarray, frequencies: np.ndarray,
+                 settlement: np.datetime64):
+        self.coupon_rates = coupon_rates
+        self.frequencies = frequencies
+        if (maturities <= settlement).any():
+            raise ValueError("Every bond must mature after the settlement date.")
+
+        # coupon dates backwards from the maturity date, k periods before it (end of month rolled to the last day)
+        months_between = 12 // frequencies
+        maturity_months = maturities.astype('datetime64[M]')
+        maturity_days = (maturities - maturity_months.astype('datetime64[D]')).astype(np.int64)
+        n_dates = int(np.max((maturity_months - settlement.astype('datetime64[M]')).astype(np.int64)
+                             // months_between)) + 2
+        months = maturity_months[:, None] - np.arange(n_dates)[None, :] * months_between[:, None]
+        month_starts = months.astype('datetime64[D]')
+        month_lengths = ((months + 1).astype('datetime64[D]') - month_starts).astype(np.int64)
+        dates = month_starts + np.minimum(maturity_days[:, None], month_lengths - 1)
+
+        # dates[:, k] decreases with k: the coupons still to be paid are the first n_remaining ones
+        n_remaining = (dates > settlement).sum(axis=1)
+        rows = np.arange(len(maturities))
+        next_coupon, previous_coupon = dates[rows, n_remaining - 1], dates[rows, n_remaining]
+        elapsed = (settlement - previous_coupon).astype(np.float64) / (next_coupon - previous_coupon).astype(np.float64)
+
+        k = np.arange(n_dates)[None, :]
+        is_cashflow = k < n_remaining[:, None]
+        coupons = 100 * coupon_rates / frequencies
+        self.periods = np.where(is_cashflow, n_remaining[:, None] - k - elapsed[:, None], 0.0)
+        self.amounts = np.where(is_cashflow, coupons[:, None], 0.0)
+        self.amounts[:, 0] += 100
+        self.accrued = coupons * elapsed
+        self.years_to_maturity = self.periods[:, 0] / frequencies
+
+    def discount_factors(self, yields: np.ndarray) -> np.ndarray:
+        """(1 + y / f) ** -periods for each cashflow."""
+        return (1 + yields / self.frequencies)[:, None] ** -self.periods
+
+    def dirty_prices(self, yields: np.ndarray) -> np.ndarray:
+        return np.sum(self.amounts * self.discount_factors(yields), axis=1)
+
+
+class BondBook:
+    """
+    Bonds priced together. The schedules are cached by settlement date (max_cached_schedules most recent ones).
+
+    Example:
+        book = BondBook(bonds)
+        ytm = book.yield_to_maturity(clean_prices)    # vectorized Newton iterations
+        analytics = book.analytics(ytm)               # price, duration, convexity and DV01 of every bond
+    """
+
+    def __init__(self, bonds: list, settlement_date: date | datetime | str = None, max_cached_schedules: int = 8):
+        self.bonds = list(bonds)
+        self.settlement_date = settlement_date
+        self.maturities = np.array([_to_day(bond.maturity_date) for bond in self.bonds], dtype='datetime64[D]')
+        self.coupon_rates = np.array([getattr(bond, 'coupon_rate', 0.0) for bond in self.bonds], dtype=np.float64)
+        self.frequencies = np.array([getattr(bond, 'frequency', 2) for bond in self.bonds], dtype=np.int64)
+        self.face_values = np.array([bond.face_value for bond in self.bonds], dtype=np.float64)
+        if (12 % self.frequencies).any():
+            raise ValueError("The coupon frequency must be 1, 2, 3, 4, 6 or 12 per year.")
+        self.max_cached_schedules = max_cached_schedules
+        self._schedules: dict[np.datetime64, BondSchedule] = {}
+
+    def __len__(self):
+        return len(self.bonds)
+
+    def schedule(self, settlement_date: date | datetime | str = None) -> BondSchedule:
+        settlement_date = settlement_date if settlement_date is not None else self.settlement_date
+        settlement = _to_day(settlement_date if settlement_date is not None else date.today())
+        if settlement not in self._schedules:
+            if len(self._schedules) >= self.max_cached_schedules:
+                del self._schedules[next(iter(self._schedules))]
+            self._schedules[settlement] = BondSchedule(self.maturities, self.coupon_rates, self.frequencies,
+                                                       settlement)
+        return self._schedules[settlement]
+
+    def prices(self, yields: np.ndarray, settlement_date: date | datetime | str = None) -> np.ndarray:
+        """Clean prices per 100 of face value."""
+        schedule = self.schedule(settlement_date)
+        return schedule.dirty_prices(np.asarray(yields, dtype=np.float64)) - schedule.accrued
+
+    def yield_to_maturity(self, clean_prices: np.ndarray, settlement_date: date | datetime | str = None,
+                          tolerance: float = 1e-10, max_iterations: int = 50) -> np.ndarray:
+        """
+        Yields of all the bonds by Newton iterations on dirty price(y) = clean price + accrued interest, run only on
+        the bonds not converged yet. Starts from the usual approximation (coupon + pull to par per year) / average
+        price.
+        """
+        schedule = self.schedule(settlement_date)
+        clean_prices = np.asarray(clean_prices, dtype=np.float64)
+        targets = clean_prices + schedule.accrued
+        years = np.maximum(schedule.years_to_maturity, 1e-6)
+        yields = (100 * self.coupon_rates + (100 - clean_prices) / years) / ((100 + clean_prices) / 2)
+        lower_bound = -0.99 * self.frequencies
+
+        active = np.arange(len(yields))
+        for _ in range(max_iterations):
+            y = yields[active]
+            amounts, periods = schedule.amounts[active], schedule.periods[active]
+            frequencies = self.frequencies[active]
+            discount_factors = (1 + y / frequencies)[:, None] ** -periods
+            error = np.sum(amounts * discount_factors, axis=1) - targets[active]
+            derivative = -np.sum(amounts * periods * discount_factors, axis=1) / (frequencies * (1 + y / frequencies))
+            step = error / derivative
+            yields[active] = np.maximum(y - step, (y + lower_bound[active]) / 2)
+            active = active[np.abs(step) > tolerance]
+            if not len(active):
+                break
+        return yields
+
+    def analytics(self, yields: np.ndarray, settlement_date: date | datetime | str = None) -> pd.DataFrame:
+        """
+        Prices and risk measures of every bond for the given yields:
+        - clean_price, dirty_price and accrued_interest per 100 of face value;
+        - macaulay_duration and modified_duration in years, convexity in years²;
+        - dv01: change of the dirty value of the face value held for a 1bp fall of the yield.
+        """
+        schedule = self.schedule(settlement_date)
+        yields = np.asarray(yields, dtype=np.float64)
+        frequencies = self.frequencies
+        discounted = schedule.amounts * schedule.discount_factors(yields)
+        dirty_prices = discounted.sum(axis=1)
+        macaulay_duration = np.sum(discounted * schedule.periods, axis=1) / dirty_prices / frequencies
+        modified_duration = macaulay_duration / (1 + yields / frequencies)
+        convexity = np.sum(discounted * schedule.periods * (schedule.periods + 1), axis=1) / dirty_prices \
+            / (frequencies * (1 + yields / frequencies)) ** 2
+        dv01 = modified_duration * dirty_prices / 100 * self.face_values * 1e-4
+        return pd.DataFrame({
+            'ytm': yields,
+            'clean_price': dirty_prices - schedule.accrued,
+            'dirty_price': dirty_prices,
+            'accrued_interest': schedule.accrued,
+            'macaulay_duration': macaulay_duration,
+            'modified_duration': modified_duration,
+            'convexity': convexity,
+            'dv01': dv01,
+        }, index=pd.Index([getattr(bond, 'symbol', getattr(bond, 'ticker', None)) for bond in self.bonds]))
+
+
+if __name__ == '__main__':
+    import time
+    from types import SimpleNamespace
+
+    from scipy.optimize import brentq
+
+    n_bonds = 5000
+    rng = np.random.default_rng(0)
+    settlement = '2024-03-15'
+    maturities = pd.Timestamp(settlement) + pd.to_timedelta(rng.integers(30, 30 * 365, n_bonds), unit='D')
+    bonds = [SimpleNamespace(symbol=f'BOND_{i}', face_value=1_000_000, maturity_date=maturity,
+                             coupon_rate=round(float(coupon), 3), frequency=int(frequency))
+             for i, (maturity, coupon, frequency) in enumerate(zip(maturities, rng.uniform(0, 0.08, n_bonds),
+                                                                   rng.choice([1, 2, 4], n_bonds)))]
+    book = BondBook(bonds, settlement)
+    start = time.perf_counter()
+    book.schedule()
+    schedule_time = time.perf_counter() - start
+    true_yields = rng.uniform(0.0, 0.09, n_bonds)
+    clean_prices = book.prices(true_yields)
+
+    start = time.perf_counter()
+    ytm = book.yield_to_maturity(clean_prices)
+    analytics = book.analytics(ytm)
+    solve_time = time.perf_counter() - start
+    print(f"{n_bonds} bonds: schedules {schedule_time:.3f}s, YTM and analytics {solve_time:.3f}s, "
+          f"max yield error {np.max(np.abs(ytm - true_yields)):.2e}")
+
+    # one bond at a time with a scalar root finder, and duration/convexity against finite differences
+    schedule = book.schedule()
+    start = time.perf_counter()
+    loop_ytm = [brentq(lambda y, i=i: np.sum(schedule.amounts[i] * (1 + y / book.frequencies[i])
+                                             ** -schedule.periods[i]) - clean_prices[i] - schedule.accrued[i],
+                       -0.5, 1.0, xtol=1e-12) for i in range(500)]
+    print(f"scalar root finder: {(time.perf_counter() - start) * n_bonds / 500:.2f}s for {n_bonds} bonds, "
+          f"max difference {np.max(np.abs(np.array(loop_ytm) - ytm[:500])):.2e}")
+    bump = 1e-5
+    up, down = schedule.dirty_prices(ytm + bump), schedule.dirty_prices(ytm - bump)
+    dirty = analytics['dirty_price'].to_numpy()
+    print(f"modified duration vs finite differences: "
+          f"{np.max(np.abs((down - up) / (2 * bump * dirty) - analytics['modified_duration'])):.2e}, convexity: "
+          f"{np.max(np.abs((up + down - 2 * dirty) / (bump ** 2 * dirty) - analytics['convexity'])):.2e}")
+    print(analytics.head())
@@ -1,5 +1,10 @@
+from datetime import datetime
+
+import numpy as np
 import pandas as pd
+from exercise.s4.s4_resources.lazy_property import LazyProperty
 from exercise.s4.s4_resources.quote import Quote
+from exercise.s4.s4_resources.quote_store import QuoteStore
 
 
 class Instrument:
@@ -9,6 +14,7 @@ class Instrument:
         self.last_quote: Quote = quote
         self.currency: str = currency
         self.quote_history: [Quote] = []
+        self._history_source: QuoteStore | str | pd.DataFrame | None = None
 
     def __str__(self):
         print(f'Instrument with ticker {self.ticker}, currency {self.currency} and last quote {self.last_quote}')
@@ -17,12 +23,70 @@ class Instrument:
         self.quote_history.append(self.last_quote)
         self.last_quote = new_quote
 
-    def populate_quote_history_from_df(self, df_data: pd.DataFrame):
+    def populate_quote_history_from_df(self, df_data: pd.DataFrame, lazy: bool = False):
+        """
+        Builds the quote history from the 'Close' column of df_data, replacing any previous history. With lazy=True, no
+        Quote object is created: the whole DataFrame is converted to a QuoteStore (arrays of timestamps and prices) on
+        first access to the history.
+        """
+        if lazy:
+            self.attach_quote_store(df_data)
+            return
+        self._history_source = None
+        self.__dict__.pop('quote_store', None)
         dates = df_data.index.to_pydatetime().tolist()
         prices = df_data['Close'].tolist()
         self.quote_history = [Quote(date, price) for date, price in zip(dates, prices)]
 
+    def attach_quote_store(self, quote_store: QuoteStore | str | pd.DataFrame):
+        """
+        Uses a QuoteStore as quote history. A folder of a saved store or a DataFrame can be given instead: it is only
+        opened or converted (as a whole) on first access. Quotes added afterwards with update_price are kept in
+        quote_history after the quotes of the store.
+        """
+        self._history_source = quote_store
+        self.__dict__.pop('quote_store', None)
+        self.quote_history = []
+
+    @LazyProperty
+    def quote_store(self) -> QuoteStore | None:
+        source = self._history_source
+        if isinstance(source, str):
+            return QuoteStore.open(source)
+        if isinstance(source, pd.DataFrame):
+            return QuoteStore.from_dataframe(source)
+        return source
+
+    def history_tail(self, n: int) -> QuoteStore:
+        """Returns the last n quotes of the history. Only this range is read from the backing store."""
+        if self.quote_store is None:
+            return QuoteStore.from_quotes(self.quote_history[-n:] if n > 0 else [])
+        return self._with_recent_quotes(self.quote_store.tail(n)).tail(n)
+
+    def history_since(self, start_date: datetime) -> QuoteStore:
+        """Returns the quotes dated on or after start_date."""
+        return self.history_window(start_date, None)
+
+    def history_window(self, start_date: datetime = None, end_date: datetime = None) -> QuoteStore:
+        """Returns the quotes between start_date and end_date (both included, None meaning unbounded)."""
+        if self.quote_store is None:
+            return QuoteStore.from_quotes(self.quote_history).slice(start_date, end_date)
+        return self._with_recent_quotes(self.quote_store.slice(start_date, end_date)).slice(start_date, end_date)
+
+    def _with_recent_quotes(self, store_view: QuoteStore) -> QuoteStore:
+        """Appends the quotes received through update_price to a view of the store (copy only when there are some)."""
+        if not self.quote_history:
+            return store_view
+        recent = QuoteStore.from_quotes(self.quote_history)
+        return QuoteStore(np.concatenate([store_view.timestamps, recent.timestamps]),
+                          np.concatenate([store_view.prices, recent.prices]))
+
     def quotes_to_dataframe(self) -> pd.DataFrame:
+        if self.quote_store is not None:
+            df_store = self.quote_store.to_dataframe()
+            if not self.quote_history:
+                return df_store
+            return pd.concat([df_store, QuoteStore.from_quotes(self.quote_history).to_dataframe()])
         data = {
             "Date": [quote.date for quote in self.quote_history],
             "Price": [quote.price for quote in self.quote_history]
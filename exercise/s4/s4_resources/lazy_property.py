@@ -0,0 +1,17 @@
+class LazyProperty:
+    """
+    Descriptor computing an attribute on first access only. The computed value is stored on the instance under the
+    same name, so the following accesses no longer go through the descriptor. Deleting the instance attribute
+    (del obj.name) resets it: the value is computed again on next access.
+    """
+    def __init__(self, function):
+        self.function = function
+        self.name = function.__name__
+        self.__doc__ = function.__doc__
+
+    def __get__(self, obj, type=None):
+        if obj is None:
+            return self
+        value = self.function(obj)
+        setattr(obj, self.name, value)
+        return value
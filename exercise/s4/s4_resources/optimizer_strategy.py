@@ -0,0 +1,240 @@
+from abc import abstractmethod
+
+import numpy as np
+
+from exercise.s4.s4_resources.covariance import CovarianceService
+from exercise.s4.s4_resources.price_panel import PricePanel
+from exercise.s4.s4_resources.strategy import Strategy
+
+
+def project_on_simplex(values: np.ndarray, scales: np.ndarray = None, total: float = 1.0) -> np.ndarray:
+    """
+    Euclidean projection of values on {x >= 0, scales @ x = total} (the simplex of the long-only fully invested weights
+    when scales is None), in O(n log n): x = max(values - tau * scales, 0) with tau found from the sorted breakpoints.
+    """
+    scales = np.ones_like(values) if scales is None else scales
+    breakpoints = values / scales
+    order = np.argsort(-breakpoints)
+    taus = (np.cumsum((scales * values)[order]) - total) / np.cumsum((scales ** 2)[order])
+    active_count = np.flatnonzero(breakpoints[order] > taus)[-1]
+    return np.maximum(values - taus[active_count] * scales, 0.0)
+
+
+def minimize_quadratic_on_simplex(covariance: np.ndarray, initial: np.ndarray, scales: np.ndarray = None,
+                                  tolerance: float = 1e-10, max_iterations: int = 10_000) -> (np.ndarray, int):
+    """
+    Minimizes x' covariance x on {x >= 0, scales @ x = 1}.
+
+    Active set method first: on the set of held names the optimum has a closed form (covariance restricted to the set
+    solved against scales); names with a negative solution are removed, names outside the set whose marginal variance
+    is below the Lagrange multiplier are added, until the KKT conditions hold. Starting from the support of initial (the
+    previous weights), it usually ends in one or two small solves. If it does not settle, the result is refined with
+    accelerated projected gradient (FISTA with adaptive restart, step from a Gershgorin bound of the largest
+    eigenvalue).
+
+    Returns: the solution and the number of iterations.
+    """
+    n = len(covariance)
+    scales = np.ones(n) if scales is None else scales
+    is_held = initial > 0
+    if not is_held.any():
+        is_held[:] = True
+    x = None
+    for iteration in range(1, min(50, max_iterations) + 1):
+        held = np.flatnonzero(is_held)
+        solution = np.linalg.solve(covariance[np.ix_(held, held)], scales[held])
+        if scales[held] @ solution <= 0:
+            break
+        candidate = np.zeros(n)
+        candidate[held] = solution / (scales[held] @ solution)
+        if (candidate[held] < 0).any():
+            is_held[held[candidate[held] < 0]] = False
+            continue
+        x = candidate
+        # marginal variance of each name against the multiplier of the budget constraint
+        gradient = covariance @ x
+        multiplier = x @ gradient
+        violations = ~is_held & (gradient < multiplier * scales - tolerance * abs(multiplier))
+        if not violations.any():
+            return x, iteration
+        is_held |= violations
+
+    x = project_on_simplex(x if x is not None else initial, scales)
+    step = 1 / np.max(np.abs(covariance).sum(axis=1))
+    y, momentum = x.copy(), 1.0
+    for iteration in range(1, max_iterations + 1):
+        x_next = project_on_simplex(y - step * (covariance @ y), scales)
+        if np.max(np.abs(x_next - x)) < tolerance:
+            return x_next, iteration
+        next_momentum = (1 + np.sqrt(1 + 4 * momentum ** 2)) / 2
+        if (y - x_next) @ (x_next - x) > 0:  # the momentum goes uphill: restart from the last point
+            next_momentum = 1.0
+        y = x_next + (momentum - 1) / next_momentum * (x_next - x)
+        x, momentum = x_next, next_momentum
+    return x, max_iterations
+
+
+class OptimizerStrategy(Strategy):
+    """
+    Long-only fully invested strategy whose weights come from an optimization on the covariance matrix of the
+    CovarianceService (cached by universe, window and date, shared with the other users of the service).
+
+    The weights of the previous rebalancing (by ticker) are the starting point of the next optimization: from one
+    rebalancing to the next the covariance matrix changes little, so the optimizer only needs a few iterations (the
+    held names of the previous optimum are the first active set of minimize_quadratic_on_simplex).
+
+    generate_signals gives the weights as of the date of the last quote of the positions. generate_weight_matrix (used
+    by the vectorized backtest) optimizes every weight_matrix_period rows from the first full window and carries each
+    optimum forward to the next one, so that any rebalancing calendar finds weights on every date after the first
+    window (NaN, i.e. cash, before it).
+    """
+
+    def __init__(self, covariance_service: CovarianceService, window: int = None, tolerance: float = 1e-10,
+                 max_iterations: int = 10_000, weight_matrix_period: int = 21):
+        self.covariance_service = covariance_service
+        self.window = window if window is not None else covariance_service.window
+        self.tolerance = tolerance
+        self.max_iterations = max_iterations
+        self.weight_matrix_period = weight_matrix_period
+        self.previous_weights: dict[str, float] = {}
+        self.last_iterations: int | None = None
+
+    @abstractmethod
+    def _solve(self, service: CovarianceService, tickers: list[str], row: int, initial: np.ndarray) -> np.ndarray:
+        """Optimal weights of tickers as of a row of the service's panel, starting from the weights initial."""
+        pass
+
+    def optimize(self, tickers: list[str], row: int, service: CovarianceService = None) -> np.ndarray:
+        service = service if service is not None else self.covariance_service
+        previous = np.array([self.previous_weights.get(ticker, np.nan) for ticker in tickers])
+        weights = self._solve_from(service, tickers, row, previous)
+        self.previous_weights = dict(zip(tickers, weights.tolist()))
+        return weights
+
+    def _solve_from(self, service: CovarianceService, tickers: list[str], row: int,
+                    previous: np.ndarray) -> np.ndarray:
+        """_solve starting from the previous weights (NaN for a new ticker), or from equal weights without any."""
+        if np.isnan(previous).all() or np.nansum(previous) <= 0:
+            initial = np.full(len(tickers), 1 / len(tickers))
+        else:
+            initial = np.nan_to_num(previous, nan=0.0)
+        return self._solve(service, tickers, row, initial)
+
+    def generate_signals(self, data_for_signal_generation: dict):
+        tickers = list(data_for_signal_generation.keys())
+        as_of = max(position.instrument.last_quote.date for position in data_for_signal_generation.values())
+        weights = self.optimize(tickers, self.covariance_service.as_of_row(as_of))
+        return dict(zip(tickers, weights.tolist()))
+
+    def generate_weight_matrix(self, prices: np.ndarray) -> np.ndarray:
+        tickers = [str(column) for column in range(prices.shape[1])]
+        panel = PricePanel(np.arange(len(prices), dtype=np.int64), tickers, prices)
+        service = CovarianceService(panel, self.covariance_service.estimator, self.window, max_cache_entries=1)
+        weight_matrix = np.full(prices.shape, np.nan)
+        # warm start of its own, so that previous_weights (by ticker) of generate_signals is left untouched
+        previous = np.full(prices.shape[1], np.nan)
+        optimization_rows = np.arange(self.window, len(prices), self.weight_matrix_period)
+        for row in optimization_rows:
+            previous = weight_matrix[row] = self._solve_from(service, tickers, row, previous)
+        if len(optimization_rows):
+            # every date holds the weights of the last optimization on or before it
+            first_row = optimization_rows[0]
+            held_rows = np.searchsorted(optimization_rows, np.arange(first_row, len(prices)), side='right') - 1
+            weight_matrix[first_row:] = weight_matrix[optimization_rows[held_rows]]
+        return weight_matrix
+
+
+class MinimumVarianceStrategy(OptimizerStrategy):
+    """Long-only minimum variance portfolio: minimizes w' covariance w with weights >= 0 summing to 1."""
+
+    def _solve(self, service: CovarianceService, tickers: list[str], row: int, initial: np.ndarray) -> np.ndarray:
+        covariance = service.covariance_at_row(tickers, row, self.window)
+        weights, self.last_iterations = minimize_quadratic_on_simplex(covariance, initial, None, self.tolerance,
+                                                                      self.max_iterations)
+        return weights
+
+
+class MaxSharpeStrategy(OptimizerStrategy):
+    """
+    Long-only maximum Sharpe ratio portfolio, with the mean returns of the window as expected returns. Solved as the
+    minimum of y' covariance y on {y >= 0, mean_returns @ y = 1}, the weights being y / sum(y). Only the tickers with
+    a positive expected return can be held; without any, the strategy stays in cash.
+    """
+
+    def _solve(self, service: CovarianceService, tickers: list[str], row: int, initial: np.ndarray) -> np.ndarray:
+        mean_returns = service.mean_returns_at_row(tickers, row, self.window)
+        is_positive = mean_returns > 0
+        weights = np.zeros(len(tickers))
+        if not is_positive.any():
+            self.last_iterations = 0
+            return weights
+        covariance = service.covariance_at_row(tickers, row, self.window)[np.ix_(is_positive, is_positive)]
+        scales = mean_returns[is_positive]
+        initial = initial[is_positive]
+        initial = initial / (scales @ initial) if scales @ initial > 0 else 1 / (len(scales) * scales)
+        y, self.last_iterations = minimize_quadratic_on_simplex(covariance, initial, scales, self.tolerance,
+                                                                self.max_iterations)
+        weights[is_positive] = y / y.sum()
+        return weights
+
+
+class RiskParityStrategy(OptimizerStrategy):
+    """
+    Equal risk contribution portfolio: each ticker contributes w_i (covariance w)_i = w' covariance w / n to the
+    variance. Solved by cyclical coordinate descent on min 0.5 y' covariance y - sum(log(y_i)) / n (each coordinate
+    has a closed form, O(n) per coordinate with the running product covariance y), the weights being y / sum(y).
+    """
+
+    def _solve(self, service: CovarianceService, tickers: list[str], row: int, initial: np.ndarray) -> np.ndarray:
+        covariance = service.covariance_at_row(tickers, row, self.window)
+        n = len(tickers)
+        budget = 1 / n
+        variances = np.diag(covariance).copy()
+        # warm start: previous weights (small floor for new tickers) scaled to the optimum along their direction
+        y = np.maximum(initial, 1e-3 / n)
+        y *= np.sqrt(1 / (y @ covariance @ y))
+        covariance_y = covariance @ y
+        self.last_iterations = self.max_iterations
+        for iteration in range(1, self.max_iterations + 1):
+            y_previous = y.copy()
+            for i in range(n):
+                other_terms = covariance_y[i] - variances[i] * y[i]
+                y_i = (-other_terms + np.sqrt(other_terms ** 2 + 4 * variances[i] * budget)) / (2 * variances[i])
+                covariance_y += covariance[i] * (y_i - y[i])
+                y[i] = y_i
+            if np.max(np.abs(y - y_previous) / y) < np.sqrt(self.tolerance):
+                self.last_iterations = iteration
+                break
+        return y / y.sum()
+
+
+if __name__ == '__main__':
+    import time
+
+    import pandas as pd
+
+    # 2,000 names with a 5-factor structure, daily rebalancing over 5 consecutive days
+    n_dates, n_tickers = 300, 2000
+    rng = np.random.default_rng(0)
+    returns = rng.normal(0.0003, 0.01, (n_dates, 5)) @ rng.normal(0.5, 0.3, (5, n_tickers)) + \
+        rng.normal(0.0002, 0.015, (n_dates, n_tickers)) * rng.uniform(0.5, 2.0, n_tickers)
+    dates = pd.bdate_range('2023-01-02', periods=n_dates)
+    price_panel = PricePanel.from_dataframe(pd.DataFrame(100 * np.cumprod(1 + returns, axis=0), index=dates,
+                                                         columns=[f'TICKER_{i}' for i in range(n_tickers)]))
+    service = CovarianceService(price_panel, window=252)
+    tickers = price_panel.tickers
+
+    for strategy in [MinimumVarianceStrategy(service), MaxSharpeStrategy(service), RiskParityStrategy(service)]:
+        timings = []
+        for row in range(n_dates - 5, n_dates):
+            service.covariance_at_row(tickers, row)  # estimation shared with the other strategies (cached)
+            start = time.perf_counter()
+            weights = strategy.optimize(tickers, row)
+            timings.append((time.perf_counter() - start, strategy.last_iterations))
+        covariance = service.covariance_at_row(tickers, n_dates - 1)
+        risk_contributions = weights * (covariance @ weights)
+        risk_contributions = risk_contributions[weights > 0]
+        print(f"{type(strategy).__name__}: cold start {timings[0][0]:.2f}s ({timings[0][1]} iterations), "
+              f"warm start {np.mean([t for t, _ in timings[1:]]):.2f}s "
+              f"({np.mean([i for _, i in timings[1:]]):.0f} iterations), {np.sum(weights > 1e-8)} names held, "
+              f"risk contributions of the held names max/min {risk_contributions.max() / risk_contributions.min():.3f}")
@@ -0,0 +1,136 @@
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from exercise.s4.s4_resources.backtest import RebalancingCalendar
+from exercise.s4.s4_resources.execution_cost import ExecutionCostModel
+from exercise.s4.s4_resources.financial_asset_util import TRADING_DAYS, FinancialAssetUtil
+from exercise.s4.s4_resources.price_panel import PricePanel
+from exercise.s4.s4_resources.vectorized_backtest import VectorizedBacktest, VectorizedBacktestResult
+
+# Price panel of a worker process, rebuilt once by _attach_price_panel on top of the shared memory block
+_worker_panel: PricePanel | None = None
+_worker_memory: shared_memory.SharedMemory | None = None
+
+
+def _attach_price_panel(memory_name: str, shape: tuple, timestamps: np.ndarray, tickers: list[str]):
+    global _worker_panel, _worker_memory
+    _worker_memory = shared_memory.SharedMemory(name=memory_name)
+    prices = np.ndarray(shape, dtype=np.float64, buffer=_worker_memory.buf)
+    _worker_panel = PricePanel(timestamps, tickers, prices)
+
+
+def worker_price_panel() -> PricePanel:
+    """Price panel shared with the worker processes of shared_price_panel_executor, to be called inside a task."""
+    return _worker_panel
+
+
+@contextmanager
+def shared_price_panel_executor(price_panel: PricePanel, max_workers: int):
+    """
+    Process pool whose workers share the prices of price_panel: the price matrix is copied once into a shared memory
+    block that every worker maps in its own panel (worker_price_panel), so that the prices are neither pickled nor
+    copied per task. The block is released when the context exits.
+    """
+    prices = price_panel.prices
+    memory = shared_memory.SharedMemory(create=True, size=max(prices.nbytes, 1))
+    try:
+        np.ndarray(prices.shape, dtype=np.float64, buffer=memory.buf)[:] = prices
+        initializer_arguments = (memory.name, prices.shape, price_panel.timestamps, price_panel.tickers)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=_attach_price_panel,
+                                 initargs=initializer_arguments) as executor:
+            yield executor
+    finally:
+        memory.close()
+        memory.unlink()
+
+
+def performance_metrics(result: VectorizedBacktestResult) -> dict:
+    """Final NAV, annualized Sharpe ratio, max drawdown and average turnover of a backtest."""
+    daily_returns = result.returns[1:]
+    volatility = daily_returns.std(ddof=1) if len(daily_returns) > 1 else 0.0
+    sharpe_ratio = daily_returns.mean() / volatility * np.sqrt(TRADING_DAYS) if volatility > 0 else np.nan
+    max_drawdown = FinancialAssetUtil.calculate_max_drawdown(result.nav)
+    return {'final_nav': result.nav[-1], 'sharpe_ratio': sharpe_ratio,
+            'max_drawdown': max_drawdown, 'average_turnover': result.turnover.mean()}
+
+
+def _run_backtest(strategy_class, parameters: dict, rebalancing_calendar: RebalancingCalendar,
+                  execution_cost_model: ExecutionCostModel, initial_nav: float, price_panel: PricePanel = None) -> dict:
+    price_panel = price_panel if price_panel is not None else worker_price_panel()
+    result = VectorizedBacktest(price_panel, rebalancing_calendar).run(strategy_class(**parameters), initial_nav,
+                                                                       execution_cost_model)
+    return {**parameters, **performance_metrics(result)}
+
+
+class ParameterSweep:
+    """
+    Runs the vectorized backtest of a strategy for every combination of a parameter grid, e.g.
+    ParameterSweep(MomentumStrategy, {'lookback_period': [10, 20, 50]}, price_panel).run()
+
+    The backtests are spread over a process pool whose workers share the price panel (shared_price_panel_executor).
+    initial_nav is the amount invested: execution cost models that are not proportional to the traded amounts (e.g.
+    SquareRootMarketImpactCost) depend on it.
+    """
+
+    def __init__(self, strategy_class, parameter_grid: dict[str, list], price_panel: PricePanel,
+                 rebalancing_calendar: RebalancingCalendar = None, execution_cost_model: ExecutionCostModel = None,
+                 max_workers: int = None, initial_nav: float = 1.0):
+        self.strategy_class = strategy_class
+        self.parameter_grid = parameter_grid
+        self.price_panel = price_panel
+        self.rebalancing_calendar = rebalancing_calendar if rebalancing_calendar is not None else RebalancingCalendar()
+        self.execution_cost_model = execution_cost_model
+        self.max_workers = max_workers if max_workers is not None else os.cpu_count()
+        self.initial_nav = initial_nav
+        self.backtests_per_second: float | None = None
+
+    def parameter_sets(self) -> list[dict]:
+        names = list(self.parameter_grid.keys())
+        return [dict(zip(names, values)) for values in itertools.product(*self.parameter_grid.values())]
+
+    def run(self) -> pd.DataFrame:
+        """
+        Returns: A DataFrame with one row per parameter set: the parameters, final NAV, annualized Sharpe ratio, max
+        drawdown and average turnover. The throughput is stored in backtests_per_second.
+        """
+        parameter_sets = self.parameter_sets()
+        start = time.perf_counter()
+        if self.max_workers <= 1:
+            rows = [_run_backtest(self.strategy_class, parameters, self.rebalancing_calendar, self.execution_cost_model,
+                                  self.initial_nav, self.price_panel) for parameters in parameter_sets]
+        else:
+            rows = self._run_in_process_pool(parameter_sets)
+        self.backtests_per_second = len(parameter_sets) / (time.perf_counter() - start)
+        return pd.DataFrame(rows)
+
+    def _run_in_process_pool(self, parameter_sets: list[dict]) -> list[dict]:
+        with shared_price_panel_executor(self.price_panel, self.max_workers) as executor:
+            futures = [executor.submit(_run_backtest, self.strategy_class, parameters, self.rebalancing_calendar,
+                                       self.execution_cost_model, self.initial_nav) for parameters in parameter_sets]
+            return [future.result() for future in futures]
+
+
+if __name__ == '__main__':
+    from exercise.s4.s4_resources.batch_strategy import BatchMeanReversionStrategy
+    from exercise.s4.s4_resources.execution_cost import FixedBpsCost
+    from exercise.s4.s4_resources.strategy import MomentumStrategy
+
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2014-01-01', periods=2520)
+    df_prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0.0002, 0.01, (len(dates), 500)), axis=0)),
+                             index=dates, columns=[f'TICKER_{i}' for i in range(500)])
+    price_panel = PricePanel.from_dataframe(df_prices)
+
+    for strategy_class, grid in [(MomentumStrategy, {'lookback_period': list(range(5, 125, 5))}),
+                                 (BatchMeanReversionStrategy, {'mean_reversion_window': list(range(5, 125, 5))})]:
+        sweep = ParameterSweep(strategy_class, grid, price_panel, RebalancingCalendar('W'), FixedBpsCost(5))
+        results = sweep.run()
+        print(results.sort_values('sharpe_ratio', ascending=False).head(3).to_string(index=False))
+        print(f"{strategy_class.__name__}: {sweep.backtests_per_second:.1f} backtests per second")
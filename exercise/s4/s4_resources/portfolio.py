@@ -1,28 +1,39 @@
 import math
 from datetime import datetime
+import numpy as np
 import pandas as pd
 
+from exercise.s4.s4_resources.execution_cost import ExecutionCostModel, NoExecutionCost, Trade
 from exercise.s4.s4_resources.instrument import Instrument
+from exercise.s4.s4_resources.portfolio_state import PortfolioState
 from exercise.s4.s4_resources.position import Position
-from exercise.s4.s4_resources.strategy import Strategy, EqualWeightStrategy, MomentumStrategy
+from exercise.s4.s4_resources.strategy import Strategy
 
 
 class Portfolio:
-    def __init__(self, name: str, currency: str, aum: float, nav: float, portfolio_strategy: Strategy):
+    def __init__(self, name: str, currency: str, aum: float, nav: float, portfolio_strategy: Strategy,
+                 execution_cost_model: ExecutionCostModel = None):
         self.name: str = name
         self.currency: str = currency
         self.aum: float = aum
         self.nav: float = nav
         self.historical_nav = []
         self.positions: [Position] = []
+        self.state: PortfolioState | None = None
         self.strategy = portfolio_strategy
         self.last_signals = None
+        self.execution_cost_model = execution_cost_model if execution_cost_model is not None else NoExecutionCost()
+        self.last_trades: [Trade] = []
+        self.last_rebalancing_cost: float = 0.0
+        self.total_execution_cost: float = 0.0
 
     def _positions_to_dict(self) -> dict:
         return {position.instrument.ticker: position for position in self.positions if position.weight is not None}
 
     def initialize_position_from_instrument_list(self, instrument_list: list[Instrument]):
-        self.positions = [Position(instrument) for instrument in instrument_list]
+        self.state = PortfolioState(instrument_list)
+        self.positions = [Position(instrument, portfolio_state=self.state, slot=slot)
+                          for slot, instrument in enumerate(instrument_list)]
 
     def rebalance_portfolio(self, rebalancing_date: datetime = None):
         if rebalancing_date is None:
@@ -31,26 +42,55 @@ class Portfolio:
         positions_dict = self._positions_to_dict()
         self.last_signals = self.strategy.generate_signals(positions_dict)
 
-        for position in self.positions:
-            signal = self.last_signals.get(position.instrument.ticker)
-            self._transform_signal_to_position(signal, position, rebalancing_date)
-
-    def _transform_signal_to_position(self, signal, position, rebalancing_date):
-        if isinstance (self.strategy, EqualWeightStrategy):
-            weight = signal
-            qty = math.floor((self.aum * weight) / position.instrument.last_quote.price)
-            position.update(quantity=qty, weight=weight, date=rebalancing_date)
-        if isinstance(self.strategy, MomentumStrategy):
-            if signal == -1 :
-                weight = 0
-                qty = 0
-                position.update(quantity=qty, weight=weight, date=rebalancing_date)
-            if signal == 1:
-                weight = 1 / len([k for k, v in self.last_signals.items() if v > 0])
+        # the strategy gives its own transform of the signals into weights, applied to all the positions at once
+        if self.state is None:
+            signals = np.array([self.last_signals.get(position.instrument.ticker, np.nan)
+                                for position in self.positions], dtype=np.float64)
+            weights, mask = self.strategy.transform_signals_to_weights(signals)
+            previous_quantities = np.array([position.quantity for position in self.positions], dtype=np.float64)
+            for idx in np.flatnonzero(mask):
+                position, weight = self.positions[idx], weights[idx].item()
                 qty = math.floor((self.aum * weight) / position.instrument.last_quote.price)
                 position.update(quantity=qty, weight=weight, date=rebalancing_date)
+            quantities = np.array([position.quantity for position in self.positions], dtype=np.float64)
+            tickers = np.array([position.instrument.ticker for position in self.positions], dtype=object)
+            prices = np.array([position.instrument.last_quote.price for position in self.positions], dtype=np.float64)
+            self._record_trades(quantities - previous_quantities, tickers, prices, rebalancing_date)
+            return
+
+        signals = self.state.slot_array(self.last_signals)
+        weights, mask = self.strategy.transform_signals_to_weights(signals)
+        self.state.refresh_prices()
+        previous_quantities = self.state.quantities.copy()
+        quantities = np.zeros(len(self.state))
+        quantities[mask] = np.floor((self.aum * weights[mask]) / self.state.last_prices[mask])
+        self.state.update(mask, weights, quantities, rebalancing_date)
+        self._record_trades(self.state.quantities - previous_quantities, self.state.tickers, self.state.last_prices,
+                            rebalancing_date)
+
+    def _record_trades(self, traded_quantities: np.ndarray, tickers: np.ndarray, prices: np.ndarray,
+                       rebalancing_date: datetime):
+        """Builds the trade list of the rebalancing and computes its execution costs with the cost model."""
+        costs = self.execution_cost_model.compute_costs(np.abs(traded_quantities) * prices, prices)
+        traded_slots = np.flatnonzero(traded_quantities)
+        self.last_trades = [Trade(rebalancing_date, ticker, quantity, price, cost) for ticker, quantity, price, cost in
+                            zip(tickers[traded_slots].tolist(), traded_quantities[traded_slots].tolist(),
+                                prices[traded_slots].tolist(), costs[traded_slots].tolist())]
+        self.last_rebalancing_cost = float(costs[traded_slots].sum())
+        self.total_execution_cost += self.last_rebalancing_cost
+
+    def compute_positions_value(self) -> float:
+        """Market value of the positions at the last quote of their instrument."""
+        if self.state is not None:
+            self.state.refresh_prices()
+            return self.state.invested_value()
+        return sum(position.quantity * position.instrument.last_quote.price for position in self.positions)
 
     def portfolio_position_summary(self) -> pd.DataFrame:
+        if self.state is not None:
+            self.state.refresh_prices()
+            return self.state.summary()
+
         tickers = [position.instrument.ticker for position in self.positions]
         weights = [position.weight for position in self.positions]
         quantities = [position.quantity for position in self.positions]
@@ -63,4 +103,3 @@ class Portfolio:
             "Last close": last_prices
         }
         return pd.DataFrame(data)
-
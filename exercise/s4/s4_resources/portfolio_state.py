@@ -0,0 +1,77 @@
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from exercise.s4.s4_resources.instrument import Instrument
+
+
+class PortfolioState:
+    """
+    State of the positions of a portfolio stored in parallel NumPy arrays, one slot per instrument:
+    weight, quantity and last price (the columns of one float matrix) and the date of the last update (int64 ns).
+
+    Position objects built by the portfolio are views on one slot of these arrays, so the portfolio can update all the
+    positions at once with vectorized operations.
+    """
+    WEIGHT, QUANTITY, LAST_PRICE = 0, 1, 2
+    NOT_A_DATE = np.iinfo(np.int64).min
+
+    def __init__(self, instruments: list[Instrument]):
+        self.instruments: list[Instrument] = list(instruments)
+        self.tickers: np.ndarray = np.array([instrument.ticker for instrument in self.instruments], dtype=object)
+        self.slots: dict[str, int] = {ticker: slot for slot, ticker in enumerate(self.tickers)}
+        self.values: np.ndarray = np.zeros((len(self.instruments), 3), dtype=np.float64)
+        self.dates: np.ndarray = np.full(len(self.instruments), self.NOT_A_DATE, dtype=np.int64)
+        self.refresh_prices()
+
+    def __len__(self):
+        return len(self.instruments)
+
+    @property
+    def weights(self) -> np.ndarray:
+        return self.values[:, self.WEIGHT]
+
+    @property
+    def quantities(self) -> np.ndarray:
+        return self.values[:, self.QUANTITY]
+
+    @property
+    def last_prices(self) -> np.ndarray:
+        return self.values[:, self.LAST_PRICE]
+
+    def slot_array(self, values_by_ticker: dict[str, float]) -> np.ndarray:
+        """Array with one entry per slot from a dictionary keyed by ticker, NaN for the slots not in it."""
+        array = np.full(len(self), np.nan)
+        for ticker, value in values_by_ticker.items():
+            slot = self.slots.get(ticker)
+            if slot is not None:
+                array[slot] = value
+        return array
+
+    def refresh_prices(self):
+        """Copies the price of the last quote of every instrument in the last_prices array."""
+        self.last_prices[:] = [instrument.last_quote.price for instrument in self.instruments]
+
+    def update(self, mask: np.ndarray, weights: np.ndarray, quantities: np.ndarray, date: datetime):
+        """Sets the weights, quantities and date of the slots selected by the boolean mask."""
+        self.weights[mask] = weights[mask]
+        self.quantities[mask] = quantities[mask]
+        self.dates[mask] = pd.Timestamp(date).as_unit('ns').value
+
+    def market_values(self) -> np.ndarray:
+        return self.quantities * self.last_prices
+
+    def invested_value(self) -> float:
+        return float(self.quantities @ self.last_prices)
+
+    def date_of(self, slot: int) -> datetime | None:
+        if self.dates[slot] == self.NOT_A_DATE:
+            return None
+        return pd.Timestamp(self.dates[slot]).to_pydatetime()
+
+    def summary(self) -> pd.DataFrame:
+        """Summary of the positions. The numeric columns are a view on the state arrays (no copy)."""
+        df = pd.DataFrame(self.values, columns=["Weight", "Quantity", "Last close"], copy=False)
+        df.insert(0, "Ticker", self.tickers)
+        return df
@@ -1,14 +1,63 @@
 from datetime import datetime
 
+import pandas as pd
+
 from exercise.s4.s4_resources.instrument import Instrument
 
 
 class Position:
-    def __init__(self, instrument: Instrument, date: datetime = datetime.now(), weight: float = 0, quantity: float = 0):
+    def __init__(self, instrument: Instrument, date: datetime = datetime.now(), weight: float = 0, quantity: float = 0,
+                 portfolio_state=None, slot: int = None):
         self.instrument = instrument
-        self.date = date
-        self.weight = weight
-        self.quantity = quantity
+        self._state = portfolio_state
+        self._slot = slot
+        if portfolio_state is None:
+            self._date = date
+            self._weight = weight
+            self._quantity = quantity
+        else:
+            self.update(date=date, weight=weight, quantity=quantity)
+
+    # When the position belongs to a PortfolioState, its attributes are read from and written to the slot of the
+    # state arrays instead of the instance.
+    @property
+    def date(self) -> datetime:
+        if self._state is None:
+            return self._date
+        return self._state.date_of(self._slot)
+
+    @date.setter
+    def date(self, value: datetime):
+        if self._state is None:
+            self._date = value
+        else:
+            self._state.dates[self._slot] = pd.Timestamp(value).as_unit('ns').value
+
+    @property
+    def weight(self) -> float:
+        if self._state is None:
+            return self._weight
+        return self._state.weights[self._slot].item()
+
+    @weight.setter
+    def weight(self, value: float):
+        if self._state is None:
+            self._weight = value
+        else:
+            self._state.weights[self._slot] = value
+
+    @property
+    def quantity(self) -> float:
+        if self._state is None:
+            return self._quantity
+        return self._state.quantities[self._slot].item()
+
+    @quantity.setter
+    def quantity(self, value: float):
+        if self._state is None:
+            self._quantity = value
+        else:
+            self._state.quantities[self._slot] = value
 
     def update(self, date: datetime, weight: float, quantity: float):
         if date is not None:
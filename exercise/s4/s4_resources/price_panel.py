@@ -0,0 +1,67 @@
+import numpy as np
+import pandas as pd
+
+from exercise.s4.s4_resources.instrument import Instrument
+from exercise.s4.s4_resources.quote_store import QuoteStore
+
+
+class PricePanel:
+    """
+    Prices of several instruments aligned on a common date index: timestamps (int64 ns, sorted) and a float64 matrix of
+    shape (dates, tickers). A price missing on a date is forward filled from the previous quote of the instrument, and
+    is NaN before its first quote.
+    """
+
+    def __init__(self, timestamps: np.ndarray, tickers: list[str], prices: np.ndarray):
+        if prices.shape != (len(timestamps), len(tickers)):
+            raise ValueError("prices must have the shape (number of dates, number of tickers).")
+        self.timestamps: np.ndarray = timestamps
+        self.tickers: list[str] = list(tickers)
+        self.prices: np.ndarray = prices
+        self.ticker_index: dict[str, int] = {ticker: column for column, ticker in enumerate(self.tickers)}
+
+    @classmethod
+    def from_stores(cls, stores: dict[str, QuoteStore]):
+        timestamps = np.unique(np.concatenate([store.timestamps for store in stores.values()]))
+        prices = np.empty((len(timestamps), len(stores)), dtype=np.float64)
+        for column, store in enumerate(stores.values()):
+            # position of the last quote dated on or before each date of the panel
+            last_quote_idx = np.searchsorted(store.timestamps, timestamps, side='right') - 1
+            prices[:, column] = np.where(last_quote_idx >= 0, np.asarray(store.prices)[last_quote_idx], np.nan)
+        return cls(timestamps, list(stores.keys()), prices)
+
+    @classmethod
+    def from_instruments(cls, instruments: list[Instrument]):
+        stores = {}
+        for instrument in instruments:
+            store = instrument.quote_store
+            stores[instrument.ticker] = store if store is not None else QuoteStore.from_quotes(instrument.quote_history)
+        return cls.from_stores(stores)
+
+    @classmethod
+    def from_dataframe(cls, df_prices: pd.DataFrame):
+        """Builds a panel from a DataFrame indexed by date with one column of prices per ticker."""
+        df_prices = df_prices.sort_index().ffill()
+        timestamps = pd.DatetimeIndex(df_prices.index).as_unit('ns').asi8.astype(np.int64)
+        return cls(timestamps, [str(ticker) for ticker in df_prices.columns], df_prices.to_numpy(dtype=np.float64))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.timestamps.view('datetime64[ns]'), name='Date')
+
+    def first_complete_row(self) -> int:
+        """Index of the first date on which every instrument has a price."""
+        complete_rows = np.flatnonzero(~np.isnan(self.prices).any(axis=1))
+        if len(complete_rows) == 0:
+            raise ValueError("No date with a price for every instrument.")
+        return int(complete_rows[0])
+
+    def slice(self, start_row: int = 0, end_row: int = None):
+        """Panel restricted to the rows [start_row, end_row), sharing the arrays of this panel."""
+        return PricePanel(self.timestamps[start_row:end_row], self.tickers, self.prices[start_row:end_row])
+
+    def to_dataframe(self) -> pd.DataFrame:
+        return pd.DataFrame(self.prices, index=self.dates, columns=self.tickers, copy=False)
@@ -0,0 +1,86 @@
+import os
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from exercise.s4.s4_resources.quote import Quote
+
+
+class QuoteStore:
+    """
+    Columnar storage of a quote history: an int64 array of timestamps (nanoseconds since epoch, UTC) and a float64
+    array of prices, both sorted by date.
+
+    A store saved with save() is reopened with open() as memory-mapped arrays: nothing is parsed and the pages are only
+    read from disk when they are accessed. Slicing by date returns views on the same arrays (no copy).
+    """
+    TIMESTAMPS_FILE = 'timestamps.npy'
+    PRICES_FILE = 'prices.npy'
+
+    def __init__(self, timestamps: np.ndarray, prices: np.ndarray):
+        if len(timestamps) != len(prices):
+            raise ValueError("timestamps and prices must have the same length.")
+        self.timestamps: np.ndarray = timestamps
+        self.prices: np.ndarray = prices
+
+    @classmethod
+    def from_dataframe(cls, df_data: pd.DataFrame, column_name: str = 'Close'):
+        df_data = df_data.sort_index()
+        timestamps = pd.DatetimeIndex(df_data.index).as_unit('ns').asi8.astype(np.int64)
+        prices = df_data[column_name].to_numpy(dtype=np.float64)
+        return cls(timestamps, prices)
+
+    @classmethod
+    def from_quotes(cls, quotes: list[Quote]):
+        quotes = sorted(quotes, key=lambda quote: quote.date)
+        timestamps = pd.DatetimeIndex([quote.date for quote in quotes]).as_unit('ns').asi8.astype(np.int64)
+        prices = np.array([quote.price for quote in quotes], dtype=np.float64)
+        return cls(timestamps, prices)
+
+    @classmethod
+    def open(cls, folder_path: str):
+        """Reopens a store saved with save(). The arrays are memory-mapped in read-only mode."""
+        timestamps = np.load(os.path.join(folder_path, cls.TIMESTAMPS_FILE), mmap_mode='r')
+        prices = np.load(os.path.join(folder_path, cls.PRICES_FILE), mmap_mode='r')
+        return cls(timestamps, prices)
+
+    def save(self, folder_path: str):
+        os.makedirs(folder_path, exist_ok=True)
+        np.save(os.path.join(folder_path, self.TIMESTAMPS_FILE), np.ascontiguousarray(self.timestamps, dtype=np.int64))
+        np.save(os.path.join(folder_path, self.PRICES_FILE), np.ascontiguousarray(self.prices, dtype=np.float64))
+
+    def __len__(self):
+        return len(self.timestamps)
+
+    @staticmethod
+    def to_timestamp(date: datetime) -> int:
+        return pd.Timestamp(date).as_unit('ns').value
+
+    def slice(self, start_date: datetime = None, end_date: datetime = None):
+        """
+        Returns the quotes between start_date and end_date (both included) as a new store sharing the same arrays.
+        """
+        start = 0 if start_date is None else np.searchsorted(self.timestamps, self.to_timestamp(start_date), 'left')
+        end = len(self) if end_date is None else np.searchsorted(self.timestamps, self.to_timestamp(end_date), 'right')
+        return QuoteStore(self.timestamps[start:end], self.prices[start:end])
+
+    def tail(self, n: int):
+        """Returns the last n quotes as a view."""
+        start = max(len(self) - n, 0)
+        return QuoteStore(self.timestamps[start:], self.prices[start:])
+
+    @property
+    def dates(self) -> np.ndarray:
+        return self.timestamps.view('datetime64[ns]')
+
+    def last_quote(self) -> Quote:
+        return Quote(pd.Timestamp(self.timestamps[-1]).to_pydatetime(), float(self.prices[-1]))
+
+    def to_quotes(self) -> list[Quote]:
+        dates = pd.DatetimeIndex(self.dates).to_pydatetime().tolist()
+        return [Quote(date, price) for date, price in zip(dates, self.prices.tolist())]
+
+    def to_dataframe(self) -> pd.DataFrame:
+        index = pd.DatetimeIndex(self.dates, name='Date')
+        return pd.DataFrame({'Price': self.prices}, index=index, copy=False)
@@ -0,0 +1,327 @@
+import math
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from exercise.s4.s4_resources.financial_asset_util import TRADING_DAYS
+
+
+def _suffix_max_drawdowns(prices: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+    """
+    Max, min and max drawdown of prices[i:] for every row i of prices (dates x series, along the first axis): the max
+    drawdown from row i is the largest fall from a price of row j >= i to the lowest later price.
+    """
+    suffix_max = np.fmax.accumulate(prices[::-1], axis=0)[::-1]
+    suffix_min = np.fmin.accumulate(prices[::-1], axis=0)[::-1]
+    later_min = np.concatenate([suffix_min[1:], np.full((1,) + prices.shape[1:], np.nan)])
+    with np.errstate(invalid='ignore'):
+        falls = np.fmax(1 - later_min / prices, 0.0)
+    return suffix_max, suffix_min, np.fmax.accumulate(falls[::-1], axis=0)[::-1]
+
+
+def _prefix_max_drawdowns(prices: np.ndarray) -> (np.ndarray, np.ndarray, np.ndarray):
+    """Max, min and max drawdown of prices[:i + 1] for every row i of prices (dates x series)."""
+    prefix_max = np.fmax.accumulate(prices, axis=0)
+    prefix_min = np.fmin.accumulate(prices, axis=0)
+    with np.errstate(invalid='ignore'):
+        return prefix_max, prefix_min, np.fmax.accumulate(1 - prices / prefix_max, axis=0)
+
+
+class RollingMaxDrawdown:
+    """
+    Max drawdown of n series over their last `window` prices (peak and trough both inside the window), in amortized
+    O(1) per series.
+
+    The (max, min, max drawdown) of two consecutive blocks of prices combine into the ones of the whole block, the max
+    drawdown being the largest of the two max drawdowns and of the fall from the max of the first block to the min of
+    the second. The window is kept as a queue of two stacks: a front block of the oldest prices with the aggregates of
+    each of its suffixes, rebuilt from the back block once every `window` prices, and a back block of the latest prices
+    with their running aggregates. Every operation is done for all the series at once.
+    """
+    __slots__ = ('window', 'front_max', 'front_min', 'front_drawdown', 'front_position', 'back_prices', 'back_max',
+                 'back_min', 'back_drawdown')
+
+    def __init__(self, window: int, n_series: int):
+        self.window = window
+        self.front_max = self.front_min = self.front_drawdown = np.empty((0, n_series))
+        self.front_position = 0
+        self.back_prices: list[np.ndarray] = []
+        self.back_max = self.back_min = self.back_drawdown = None
+
+    def update(self, prices: np.ndarray) -> np.ndarray:
+        """Adds the prices of the date and returns the max drawdown of the window."""
+        if self.back_prices:
+            self.back_drawdown = np.maximum(self.back_drawdown, 1 - prices / self.back_max)
+            self.back_max = np.maximum(self.back_max, prices)
+            self.back_min = np.minimum(self.back_min, prices)
+        else:
+            self.back_max, self.back_min, self.back_drawdown = prices, prices, np.zeros(len(prices))
+        self.back_prices.append(prices)
+
+        front_count = len(self.front_max) - self.front_position
+        if front_count + len(self.back_prices) > self.window:
+            if front_count == 0:
+                self.front_max, self.front_min, self.front_drawdown = _suffix_max_drawdowns(np.array(self.back_prices))
+                self.front_position = 0
+                self.back_prices = []
+            self.front_position += 1
+
+        if self.front_position == len(self.front_max):
+            return self.back_drawdown
+        position = self.front_position
+        if not self.back_prices:
+            return self.front_drawdown[position]
+        return np.maximum(np.maximum(self.front_drawdown[position], self.back_drawdown),
+                          1 - self.back_min / self.front_max[position])
+
+
+class RollingRiskState:
+    """
+    Moments of the returns of n series and of a benchmark over their last `window` dates, updated in O(1) per series.
+
+    The returns of the window are kept in a ring buffer. Each update removes the oldest return and adds the new one to
+    the means and to the sums of squared deviations (Welford), for all the series at once. The sums are recomputed
+    from the ring buffer every `window` updates so that the rounding errors do not accumulate. The peak price of the
+    window is kept with one monotonic deque per series (decreasing prices, the front being the peak), its max drawdown
+    with a RollingMaxDrawdown.
+    """
+    __slots__ = ('window', 'returns', 'benchmark_returns', 'position', 'count', 'update_count', 'mean',
+                 'benchmark_mean', 'variance_sum', 'covariance_sum', 'benchmark_variance_sum', 'peak_deques',
+                 'price_count', 'max_drawdown')
+
+    def __init__(self, window: int, n_series: int):
+        if window < 2:
+            raise ValueError("The window must contain at least two dates.")
+        self.window = window
+        self.returns = np.zeros((window, n_series))
+        self.benchmark_returns = np.zeros(window)
+        self.position = 0
+        self.count = 0
+        self.update_count = 0
+        self.mean = np.zeros(n_series)
+        self.benchmark_mean = 0.0
+        self.variance_sum = np.zeros(n_series)
+        self.covariance_sum = np.zeros(n_series)
+        self.benchmark_variance_sum = 0.0
+        self.peak_deques = [deque() for _ in range(n_series)]
+        self.price_count = 0
+        self.max_drawdown = RollingMaxDrawdown(window, n_series)
+
+    def update_returns(self, returns: np.ndarray, benchmark_return: float):
+        if self.count == self.window:
+            self._remove(self.returns[self.position], self.benchmark_returns[self.position])
+        self.count += 1
+        delta = returns - self.mean
+        benchmark_delta = benchmark_return - self.benchmark_mean
+        self.mean += delta / self.count
+        self.benchmark_mean += benchmark_delta / self.count
+        self.variance_sum += delta * (returns - self.mean)
+        self.covariance_sum += delta * (benchmark_return - self.benchmark_mean)
+        self.benchmark_variance_sum += benchmark_delta * (benchmark_return - self.benchmark_mean)
+
+        self.returns[self.position] = returns
+        self.benchmark_returns[self.position] = benchmark_return
+        self.position = (self.position + 1) % self.window
+        self.update_count += 1
+        if self.update_count % self.window == 0:
+            self._recompute()
+
+    def _remove(self, returns: np.ndarray, benchmark_return: float):
+        # inverse of the Welford update: the means after removal are needed to remove the squared deviations
+        mean = self.mean - (returns - self.mean) / (self.count - 1)
+        benchmark_mean = self.benchmark_mean - (benchmark_return - self.benchmark_mean) / (self.count - 1)
+        self.variance_sum -= (returns - mean) * (returns - self.mean)
+        self.covariance_sum -= (returns - mean) * (benchmark_return - self.benchmark_mean)
+        self.benchmark_variance_sum -= (benchmark_return - benchmark_mean) * (benchmark_return - self.benchmark_mean)
+        self.mean, self.benchmark_mean = mean, benchmark_mean
+        self.count -= 1
+
+    def _recompute(self):
+        returns, benchmark_returns = self.returns[:self.count], self.benchmark_returns[:self.count]
+        self.mean = returns.mean(axis=0)
+        self.benchmark_mean = math.fsum(benchmark_returns) / self.count
+        deviations = returns - self.mean
+        benchmark_deviations = benchmark_returns - self.benchmark_mean
+        self.variance_sum = (deviations ** 2).sum(axis=0)
+        self.covariance_sum = benchmark_deviations @ deviations
+        self.benchmark_variance_sum = float(benchmark_deviations @ benchmark_deviations)
+
+    def update_prices(self, prices: list[float]) -> np.ndarray:
+        """Adds the prices of the date to the monotonic deques and returns the peak price of the window."""
+        index = self.price_count
+        expired = index - self.window
+        peaks = np.empty(len(prices))
+        for column, (price, peak_deque) in enumerate(zip(prices, self.peak_deques)):
+            while peak_deque and peak_deque[-1][1] <= price:
+                peak_deque.pop()
+            peak_deque.append((index, price))
+            if peak_deque[0][0] <= expired:
+                peak_deque.popleft()
+            peaks[column] = peak_deque[0][1]
+        self.price_count += 1
+        return peaks
+
+    def is_complete(self) -> bool:
+        return self.count == self.window
+
+
+class StreamingRiskEngine:
+    """
+    Rolling risk metrics of many series (volatility, Sharpe ratio, beta to a benchmark, drawdown from the peak of the
+    window and max drawdown inside the window) over several windows, updated with the prices of each new date in O(1)
+    per series and window (amortized for the max drawdown), plus the drawdown and max drawdown since inception from a
+    running peak.
+
+    Volatility and Sharpe ratio are annualized as in PerformanceAnalysisUtils.compute_sharpe_ratio
+    (theory/all_classes_extended_version.py). The metrics of a window are NaN until it holds `window` returns.
+
+    compute_history gives the same metrics for every date of a whole price history in one vectorized pass.
+    """
+
+    def __init__(self, tickers: list[str], windows: tuple[int, ...] = (30, 90, 252), risk_free_rate: float = 0.0,
+                 periods_per_year: int = TRADING_DAYS):
+        self.tickers = list(tickers)
+        self.windows = tuple(windows)
+        self.periods_per_year = periods_per_year
+        self.periodic_risk_free_rate = (1 + risk_free_rate) ** (1 / periods_per_year) - 1
+        self.states = {window: RollingRiskState(window, len(self.tickers)) for window in self.windows}
+        self.last_prices: np.ndarray | None = None
+        self.last_benchmark_price: float | None = None
+        self.running_peaks = np.full(len(self.tickers), -np.inf)
+        self.drawdowns = np.zeros(len(self.tickers))
+        self.max_drawdowns = np.zeros(len(self.tickers))
+        self.window_drawdowns = {window: np.zeros(len(self.tickers)) for window in self.windows}
+        self.window_max_drawdowns = {window: np.zeros(len(self.tickers)) for window in self.windows}
+
+    def update(self, prices: np.ndarray, benchmark_price: float = None):
+        """
+        Parameters:
+        - prices: prices of the new date, one per ticker (in the order of tickers), without NaN.
+        - benchmark_price: price of the benchmark on the same date, needed for the betas.
+        """
+        prices = np.asarray(prices, dtype=np.float64)
+        if self.last_prices is not None:
+            returns = prices / self.last_prices - 1
+            benchmark_return = 0.0
+            if benchmark_price is not None and self.last_benchmark_price is not None:
+                benchmark_return = benchmark_price / self.last_benchmark_price - 1
+            for state in self.states.values():
+                state.update_returns(returns, benchmark_return)
+        self.last_prices = prices
+        self.last_benchmark_price = benchmark_price
+
+        np.maximum(self.running_peaks, prices, out=self.running_peaks)
+        self.drawdowns = 1 - prices / self.running_peaks
+        np.maximum(self.max_drawdowns, self.drawdowns, out=self.max_drawdowns)
+        price_list = prices.tolist()
+        for window, state in self.states.items():
+            self.window_drawdowns[window] = 1 - prices / state.update_prices(price_list)
+            self.window_max_drawdowns[window] = state.max_drawdown.update(prices)
+
+    def metrics(self) -> pd.DataFrame:
+        """Last value of every metric, one row per ticker, columns named <metric>_<window>."""
+        columns = {'drawdown': self.drawdowns, 'max_drawdown': self.max_drawdowns}
+        for window, state in self.states.items():
+            if state.is_complete():
+                volatility = np.sqrt(state.variance_sum / (window - 1))
+                sharpe_ratio = (state.mean - self.periodic_risk_free_rate) / volatility
+                beta = state.covariance_sum / state.benchmark_variance_sum if state.benchmark_variance_sum > 0 \
+                    else np.full(len(self.tickers), np.nan)
+            else:
+                volatility = sharpe_ratio = beta = np.full(len(self.tickers), np.nan)
+            columns[f'volatility_{window}'] = volatility * math.sqrt(self.periods_per_year)
+            columns[f'sharpe_ratio_{window}'] = sharpe_ratio * math.sqrt(self.periods_per_year)
+            columns[f'beta_{window}'] = beta
+            columns[f'drawdown_{window}'] = self.window_drawdowns[window]
+            columns[f'max_drawdown_{window}'] = self.window_max_drawdowns[window]
+        return pd.DataFrame(columns, index=pd.Index(self.tickers, name='Ticker'))
+
+    def compute_history(self, prices: pd.DataFrame, benchmark: pd.Series = None) -> dict[str, pd.DataFrame]:
+        """
+        Metrics of every date of a price history (dates x tickers), computed for all the series at once. Does not
+        change the state of the engine.
+
+        Returns: A dictionary with the metric names of metrics() as keys and DataFrames (dates x tickers) as values.
+        """
+        returns = prices.pct_change()
+        running_peaks = prices.cummax()
+        drawdowns = 1 - prices / running_peaks
+        history = {'drawdown': drawdowns, 'max_drawdown': drawdowns.cummax()}
+        benchmark_returns = benchmark.reindex(prices.index).pct_change() if benchmark is not None else None
+        annualization = math.sqrt(self.periods_per_year)
+        for window in self.windows:
+            rolling_returns = returns.rolling(window)
+            mean = rolling_returns.mean()
+            volatility = rolling_returns.std()
+            history[f'volatility_{window}'] = volatility * annualization
+            history[f'sharpe_ratio_{window}'] = (mean - self.periodic_risk_free_rate) / volatility * annualization
+            if benchmark_returns is not None:
+                # covariance from the rolling means of the products (as pandas does), much faster than rolling().cov
+                benchmark_mean = benchmark_returns.rolling(window).mean()
+                covariance = (returns.mul(benchmark_returns, axis=0).rolling(window).mean()
+                              - mean.mul(benchmark_mean, axis=0)) * window / (window - 1)
+                history[f'beta_{window}'] = covariance.div(benchmark_returns.rolling(window).var(), axis=0)
+            else:
+                history[f'beta_{window}'] = pd.DataFrame(np.nan, index=prices.index, columns=prices.columns)
+            history[f'drawdown_{window}'] = 1 - prices / prices.rolling(window, min_periods=1).max()
+            history[f'max_drawdown_{window}'] = pd.DataFrame(self._rolling_max_drawdowns(prices.to_numpy(), window),
+                                                             index=prices.index, columns=prices.columns)
+        return history
+
+    @staticmethod
+    def _rolling_max_drawdowns(prices: np.ndarray, window: int) -> np.ndarray:
+        """
+        Max drawdown of the last `window` prices (fewer on the first dates) of every date, in one pass: the dates are
+        cut in blocks of `window` rows, and the window of a date is a suffix of the previous block followed by a
+        prefix of its own block, whose aggregates are combined as in RollingMaxDrawdown.
+        """
+        n_dates = len(prices)
+        n_blocks = -(-n_dates // window)
+        padded = np.concatenate([prices, np.repeat(prices[-1:], n_blocks * window - n_dates, axis=0)])
+        # aggregates inside each block of `window` rows, back to (dates x series)
+        blocks = padded.reshape((n_blocks, window) + prices.shape[1:]).swapaxes(0, 1)
+        _, prefix_min, prefix_drawdown = (aggregate.swapaxes(0, 1).reshape(padded.shape)[:n_dates]
+                                          for aggregate in _prefix_max_drawdowns(blocks))
+        suffix_max, _, suffix_drawdown = (aggregate.swapaxes(0, 1).reshape(padded.shape)
+                                          for aggregate in _suffix_max_drawdowns(blocks))
+
+        max_drawdowns = prefix_drawdown.copy()  # windows starting at the start of a block (and the first dates)
+        rows = np.arange(n_dates)
+        spanning = (rows >= window) & ((rows + 1) % window != 0)
+        ends, starts = rows[spanning], rows[spanning] - window + 1
+        with np.errstate(invalid='ignore'):
+            max_drawdowns[ends] = np.fmax(np.fmax(suffix_drawdown[starts], prefix_drawdown[ends]),
+                                          1 - prefix_min[ends] / suffix_max[starts])
+        return max_drawdowns
+
+
+if __name__ == '__main__':
+    import time
+
+    n_dates, n_series = 1000, 2000
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2020-01-01', periods=n_dates)
+    market_returns = rng.normal(0.0003, 0.01, n_dates)
+    series_returns = 0.8 * market_returns[:, None] + rng.normal(0, 0.01, (n_dates, n_series))
+    df_prices = pd.DataFrame(100 * np.cumprod(1 + series_returns, axis=0), index=dates,
+                             columns=[f'TICKER_{i}' for i in range(n_series)])
+    benchmark = pd.Series(100 * np.cumprod(1 + market_returns), index=dates)
+
+    engine = StreamingRiskEngine(df_prices.columns, risk_free_rate=0.02)
+    price_matrix = df_prices.to_numpy()
+    start = time.perf_counter()
+    for row in range(n_dates):
+        engine.update(price_matrix[row], benchmark.iloc[row])
+    streaming_time = time.perf_counter() - start
+    streaming_metrics = engine.metrics()
+
+    start = time.perf_counter()
+    history = engine.compute_history(df_prices, benchmark)
+    vectorized_time = time.perf_counter() - start
+
+    max_difference = max(np.nanmax(np.abs(streaming_metrics[name].to_numpy() - history[name].iloc[-1].to_numpy()))
+                         for name in streaming_metrics.columns)
+    print(f"{n_series} series x {n_dates} dates: streaming {streaming_time / n_dates * 1000:.2f}ms per date, "
+          f"vectorized history {vectorized_time:.2f}s, max difference on the last date {max_difference:.2e}")
+    print(streaming_metrics.iloc[:3].T.to_string())
@@ -1,7 +1,13 @@
+from collections import deque
 from datetime import datetime
 import math
 from abc import ABC, abstractmethod
 
+import numpy as np
+
+from exercise.s4.s4_resources.quote_store import QuoteStore
+
+
 class Strategy(ABC):
     @abstractmethod
     def generate_signals(self, data_for_signal_generation: dict):
@@ -14,6 +20,41 @@ class Strategy(ABC):
         """
         pass
 
+    def generate_weight_matrix(self, prices: np.ndarray) -> np.ndarray:
+        """
+        Method used by the vectorized backtest to get the target weights of every date at once. Only the vectorized
+        backtest needs it: strategies implementing generate_signals only still work with the Portfolio.
+
+        Parameters: prices, a matrix of shape (dates, tickers). Row t must only use the prices of rows 0 to t.
+        Return: A matrix of the same shape with the target weights. NaN means that the weight is left unchanged.
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support the vectorized backtest: it does not "
+                                  f"implement generate_weight_matrix.")
+
+    def transform_signals_to_weights(self, signals: np.ndarray) -> (np.ndarray, np.ndarray):
+        """
+        Method used by the Portfolio to turn the signals of all its positions into target weights in one call. By
+        default the signals are the target weights; strategies with other signals override it.
+
+        Parameters: signals, a vector with the signal of each position (NaN when a position has no signal).
+        Return: the vector of target weights and the boolean mask of the positions to update.
+        """
+        mask = ~np.isnan(signals)
+        return np.where(mask, signals, 0.0), mask
+
+
+def buy_sell_signals_to_weights(signals: np.ndarray) -> (np.ndarray, np.ndarray):
+    """
+    Transform of buy (1) / sell (-1) / hold (0) signals: positions with a buy signal are equally weighted, positions
+    with a sell signal are sold and positions with a hold signal are left unchanged. Works on a vector of signals or on
+    a matrix of shape (dates, tickers).
+    """
+    is_buy = signals == 1
+    buy_count = is_buy.sum(axis=-1, keepdims=True)
+    buy_weight = np.divide(1, buy_count, out=np.zeros(buy_count.shape), where=buy_count > 0)
+    return np.where(is_buy, buy_weight, 0.0), is_buy | (signals == -1)
+
+
 class EqualWeightStrategy(Strategy):
 
     def generate_signals(self, data_for_signal_generation: dict):
@@ -22,6 +63,9 @@ class EqualWeightStrategy(Strategy):
         equal_wgt = 1 / len(tickers)
         return {ticker: equal_wgt for ticker in tickers}
 
+    def generate_weight_matrix(self, prices: np.ndarray) -> np.ndarray:
+        return np.full(prices.shape, 1 / prices.shape[1])
+
 
 class MomentumStrategy(Strategy):
     def __init__(self, lookback_period: int):
@@ -46,4 +90,128 @@ class MomentumStrategy(Strategy):
             latest_signal = df_prices.at[latest_date, 'Signal']
             signals[ticker] = latest_signal
 
-        return signals
\ No newline at end of file
+        return signals
+
+    def generate_weight_matrix(self, prices: np.ndarray) -> np.ndarray:
+        weights, mask = buy_sell_signals_to_weights(self._signal_matrix(prices))
+        return np.where(mask, weights, np.nan)
+
+    def transform_signals_to_weights(self, signals: np.ndarray) -> (np.ndarray, np.ndarray):
+        return buy_sell_signals_to_weights(signals)
+
+    def _signal_matrix(self, prices: np.ndarray) -> np.ndarray:
+        """Same signals as generate_signals for every date: sign of the price minus its rolling mean, 0 when the
+        rolling mean is not available."""
+        window = self.lookback_period
+        is_valid = ~np.isnan(prices)
+        zeros = np.zeros((1, prices.shape[1]))
+        cumulative_sum = np.concatenate([zeros, np.cumsum(np.where(is_valid, prices, 0.0), axis=0)])
+        cumulative_count = np.concatenate([zeros, np.cumsum(is_valid, axis=0)])
+
+        avg_price = np.full(prices.shape, np.nan)
+        window_sum = cumulative_sum[window:] - cumulative_sum[:-window]
+        window_count = cumulative_count[window:] - cumulative_count[:-window]
+        avg_price[window - 1:] = np.where(window_count == window, window_sum / window, np.nan)
+
+        momentum = prices - avg_price
+        return np.where(np.isnan(momentum), 0, np.sign(momentum)).astype(np.int64)
+
+
+class RollingMeanState:
+    """Rolling sum of the last `window` prices of one instrument, updated in O(1) for each new price."""
+    __slots__ = ('window', 'prices', 'total', 'nan_count', 'update_count', 'last_timestamp')
+
+    def __init__(self, window: int):
+        self.window = window
+        self.prices = deque(maxlen=window)
+        self.total = 0.0
+        self.nan_count = 0
+        self.update_count = 0
+        self.last_timestamp = None
+
+    def update(self, price: float):
+        if len(self.prices) == self.window:
+            oldest_price = self.prices[0]
+            if math.isnan(oldest_price):
+                self.nan_count -= 1
+            else:
+                self.total -= oldest_price
+        self.prices.append(price)
+        if math.isnan(price):
+            self.nan_count += 1
+        else:
+            self.total += price
+        self.update_count += 1
+        if self.update_count % self.window == 0:  # recompute the sum from time to time to avoid rounding drift
+            self.total = math.fsum(p for p in self.prices if not math.isnan(p))
+
+    def signal(self) -> int:
+        if len(self.prices) < self.window or self.nan_count > 0:
+            return 0
+        momentum = self.prices[-1] - self.total / self.window
+        if momentum > 0:
+            return 1
+        if momentum < 0:
+            return -1
+        return 0
+
+
+class IncrementalMomentumStrategy(MomentumStrategy):
+    """
+    MomentumStrategy keeping a rolling sum per instrument instead of rebuilding a DataFrame of the whole history on
+    every rebalancing. On each call, only the quotes added to the history since the previous call are read, so a
+    backtest rebalancing every day is linear in the length of the history. Quotes can also be pushed with on_quote.
+    """
+
+    def __init__(self, lookback_period: int):
+        super().__init__(lookback_period)
+        self.states: dict[str, RollingMeanState] = {}
+
+    def _state(self, ticker: str) -> RollingMeanState:
+        state = self.states.get(ticker)
+        if state is None:
+            state = self.states[ticker] = RollingMeanState(self.lookback_period)
+        return state
+
+    def on_quote(self, ticker: str, quote):
+        self._state(ticker).update(quote.price)
+
+    def generate_signals(self, position_for_signal_generation: dict):
+        signals = {}
+        for ticker, position in position_for_signal_generation.items():
+            state = self._state(ticker)
+            self._consume_new_quotes(position.instrument, state)
+            signals[ticker] = state.signal()
+        return signals
+
+    def _consume_new_quotes(self, instrument, state: RollingMeanState):
+        """Feeds the state with the prices dated after the last consumed quote (only the last lookback_period of
+        them matter): first from the quote store of the instrument, then from its quote_history."""
+        last_timestamp = state.last_timestamp
+        new_prices = []
+        store = instrument.quote_store
+        if store is not None and len(store):
+            start = 0
+            if last_timestamp is not None:
+                start = int(np.searchsorted(store.timestamps, last_timestamp, side='right'))
+            if start < len(store):
+                new_prices = store.prices[max(start, len(store) - self.lookback_period):].tolist()
+                state.last_timestamp = int(store.timestamps[-1])
+
+        recent_quotes = []
+        for quote in reversed(instrument.quote_history):
+            if len(recent_quotes) == self.lookback_period:
+                break
+            if last_timestamp is not None and QuoteStore.to_timestamp(quote.date) <= last_timestamp:
+                break
+            recent_quotes.append(quote)
+        if recent_quotes:
+            state.last_timestamp = QuoteStore.to_timestamp(recent_quotes[0].date)
+        new_prices.extend(quote.price for quote in reversed(recent_quotes))
+
+        for price in new_prices[-self.lookback_period:]:
+            state.update(price)
+
+    def reset(self):
+        """Forgets the rolling state of every instrument, e.g. before running a new backtest."""
+        self.states = {}
@@ -0,0 +1,148 @@
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from exercise.s4.s4_resources.backtest import BacktestResult, RebalancingCalendar
+from exercise.s4.s4_resources.execution_cost import ExecutionCostModel
+from exercise.s4.s4_resources.price_panel import PricePanel
+from exercise.s4.s4_resources.strategy import Strategy
+
+
+@dataclass
+class VectorizedBacktestResult(BacktestResult):
+    returns: np.ndarray
+    turnover: np.ndarray
+    weights: np.ndarray
+    execution_costs: np.ndarray
+
+    def summary(self) -> dict:
+        return {'final_nav': self.nav[-1], 'total_return': self.nav[-1] / self.nav[0] - 1,
+                'average_turnover': self.turnover.mean() if len(self.turnover) else 0.0,
+                'total_execution_cost': self.execution_costs.sum()}
+
+
+class VectorizedBacktest:
+    """
+    Backtest computed with matrix operations instead of a loop over dates.
+
+    The strategy gives its target weights for every date at once (Strategy.generate_weight_matrix). On rebalancing
+    dates the portfolio is invested at these weights (fractional quantities, the rest in cash), then the holdings drift
+    with prices until the next rebalancing date. The NAV of each date is the NAV of the last rebalancing date times the
+    growth of the holdings since then; the NAV of the rebalancing dates is a cumulative product.
+
+    With an execution cost model, the cost of the weight changes of every rebalancing is computed in one call on the
+    (rebalancing dates x tickers) matrix of traded amounts and paid from the cash, as in BacktestEngine. For the
+    square-root impact, whose cost is not proportional to the NAV, traded amounts are sized on the NAV without costs
+    (close approximation); the linear models (fixed bps, spread) are exact.
+    """
+
+    def __init__(self, price_panel: PricePanel, rebalancing_calendar: RebalancingCalendar = None):
+        self.price_panel = price_panel
+        self.rebalancing_calendar = rebalancing_calendar if rebalancing_calendar is not None else RebalancingCalendar()
+
+    def run(self, strategy: Strategy, initial_nav: float = 1.0,
+            execution_cost_model: ExecutionCostModel = None) -> VectorizedBacktestResult:
+        panel = self.price_panel.slice(self.price_panel.first_complete_row())
+        return self._run(panel, strategy.generate_weight_matrix(panel.prices), initial_nav, execution_cost_model)
+
+    def run_weight_matrix(self, weight_matrix: np.ndarray, initial_nav: float = 1.0,
+                          execution_cost_model: ExecutionCostModel = None,
+                          initial_weights: np.ndarray = None) -> VectorizedBacktestResult:
+        """
+        Backtest of target weights already computed for every date of the price panel (same shape as its prices), e.g.
+        the weight matrix of a strategy computed once on a long history and backtested over several windows.
+
+        initial_weights are the weights held before the first rebalancing (all cash by default): the turnover and the
+        execution costs of the first date are those of the trades from them to the first target weights.
+        """
+        start_row = self.price_panel.first_complete_row()
+        return self._run(self.price_panel.slice(start_row), weight_matrix[start_row:], initial_nav,
+                         execution_cost_model, initial_weights)
+
+    def _run(self, panel: PricePanel, weight_matrix: np.ndarray, initial_nav: float,
+             execution_cost_model: ExecutionCostModel, initial_weights: np.ndarray = None) -> VectorizedBacktestResult:
+        prices = panel.prices
+
+        rebalancing_mask = self.rebalancing_calendar.rebalancing_mask(panel.timestamps)
+        rebalancing_mask[0] = True
+        rebalancing_rows = np.flatnonzero(rebalancing_mask)
+
+        # target weights on rebalancing dates, NaN meaning "same weight as on the previous rebalancing date"
+        target_weights = weight_matrix[rebalancing_rows]
+        target_weights = pd.DataFrame(target_weights).ffill().fillna(0.0).to_numpy()
+        cash_weights = 1 - target_weights.sum(axis=1)
+
+        # growth of the holdings of each rebalancing date, evaluated at every following date of its segment
+        segment = np.cumsum(rebalancing_mask) - 1
+        segment_start_rows = rebalancing_rows[segment]
+        relative_prices = prices / prices[segment_start_rows]
+        segment_weights = target_weights[segment]
+        growth = np.einsum('ij,ij->i', segment_weights, relative_prices) + cash_weights[segment]
+
+        # growth of each segment up to the next rebalancing date (included), chained into the rebalancing NAVs
+        next_rows = rebalancing_rows[1:]
+        previous_weights = target_weights[:-1]
+        drifted_holdings = previous_weights * prices[next_rows] / prices[rebalancing_rows[:-1]]
+        segment_growth = drifted_holdings.sum(axis=1) + cash_weights[:-1]
+        first_weights = np.zeros(prices.shape[1]) if initial_weights is None else initial_weights
+        drifted_weights = np.vstack([first_weights, drifted_holdings / segment_growth[:, None]])
+        weight_changes = np.abs(target_weights - drifted_weights)
+        turnover = weight_changes.sum(axis=1)
+
+        # execution costs of each rebalancing as a fraction of the NAV before trading, paid from the cash
+        cost_fractions = np.zeros(len(rebalancing_rows))
+        if execution_cost_model is not None:
+            gross_rebalancing_nav = initial_nav * np.concatenate([[1.0], np.cumprod(segment_growth)])
+            traded_notional = weight_changes * gross_rebalancing_nav[:, None]
+            costs = execution_cost_model.compute_costs(traded_notional, prices[rebalancing_rows])
+            cost_fractions = costs.sum(axis=1) / gross_rebalancing_nav
+
+        rebalancing_nav = initial_nav * np.concatenate([[1.0], np.cumprod(segment_growth - cost_fractions[:-1])])
+        nav = rebalancing_nav[segment] * (growth - cost_fractions[segment])
+        execution_costs = cost_fractions * rebalancing_nav
+        returns = np.concatenate([[0.0], nav[1:] / nav[:-1] - 1])
+
+        return VectorizedBacktestResult(panel.dates, nav, panel.dates[rebalancing_rows], returns, turnover,
+                                        target_weights, execution_costs)
+
+
+if __name__ == '__main__':
+    # Cross-check of the vectorized backtest against the event-driven BacktestEngine on random prices
+    import time
+
+    from exercise.s4.s4_resources.backtest import BacktestEngine
+    from exercise.s4.s4_resources.execution_cost import FixedBpsCost
+    from exercise.s4.s4_resources.instrument import Instrument
+    from exercise.s4.s4_resources.portfolio import Portfolio
+    from exercise.s4.s4_resources.quote import Quote
+    from exercise.s4.s4_resources.strategy import EqualWeightStrategy, MomentumStrategy
+
+    rng = np.random.default_rng(42)
+    dates = pd.bdate_range('2014-01-01', periods=2520)
+    df_prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, (len(dates), 30)), axis=0)),
+                             index=dates, columns=[f'TICKER_{i}' for i in range(30)])
+    price_panel = PricePanel.from_dataframe(df_prices)
+    calendar = RebalancingCalendar('M')
+
+    cost_model = FixedBpsCost(bps=10)
+    for strategy in [EqualWeightStrategy(), MomentumStrategy(lookback_period=20)]:
+        instruments = []
+        for ticker in df_prices.columns:
+            instrument = Instrument(ticker, 'XPAR', Quote(dates[-1], df_prices[ticker].iloc[-1]), 'USD')
+            instrument.populate_quote_history_from_df(df_prices[[ticker]].rename(columns={ticker: 'Close'}), lazy=True)
+            instruments.append(instrument)
+        portfolio = Portfolio('cross check', 'USD', aum=1e9, nav=1e9, portfolio_strategy=strategy,
+                              execution_cost_model=cost_model)
+        portfolio.initialize_position_from_instrument_list(instruments)
+
+        start = time.time()
+        event_nav = BacktestEngine(portfolio, price_panel, calendar).run().nav
+        event_time = time.time() - start
+        start = time.time()
+        vectorized_nav = VectorizedBacktest(price_panel, calendar).run(strategy, 1e9, cost_model).nav
+        vectorized_time = time.time() - start
+
+        print(f"{type(strategy).__name__}: max relative NAV difference "
+              f"{np.max(np.abs(vectorized_nav / event_nav - 1)):.2e}, "
+              f"event-driven {event_time:.2f}s, vectorized {vectorized_time:.4f}s")
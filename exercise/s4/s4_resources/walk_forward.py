@@ -0,0 +1,193 @@
+import os
+from dataclasses import dataclass
+
+import numpy as np
+import pandas as pd
+
+from exercise.s4.s4_resources.backtest import RebalancingCalendar
+from exercise.s4.s4_resources.execution_cost import ExecutionCostModel
+from exercise.s4.s4_resources.parameter_sweep import ParameterSweep, performance_metrics, \
+    shared_price_panel_executor, worker_price_panel
+from exercise.s4.s4_resources.price_panel import PricePanel
+from exercise.s4.s4_resources.vectorized_backtest import VectorizedBacktest
+
+
+@dataclass
+class WalkForwardResult:
+    windows: pd.DataFrame  # one row per window: dates, selected parameters, in-sample and out-of-sample metrics
+    dates: pd.DatetimeIndex
+    nav: np.ndarray  # out-of-sample NAV from the last train date of the first window, the test windows chained
+
+    def nav_series(self) -> pd.Series:
+        return pd.Series(self.nav, index=self.dates, name='NAV')
+
+
+def _evaluate_parameters(strategy_class, parameters: dict, windows: list[tuple], rebalancing_calendar,
+                         execution_cost_model, objective: str, initial_nav: float,
+                         price_panel: PricePanel = None) -> dict:
+    """
+    Backtests one parameter set on every train and test window. The weight matrix of the strategy is computed once on
+    the whole panel and each window backtests a slice of it, so the indicators are not recomputed for overlapping
+    windows.
+
+    The rebalancing dates are those of the whole panel, and each window starts from the holdings of a backtest of the
+    whole panel on its first date, so chaining windows of the same parameter set gives the NAV of that backtest.
+    """
+    panel = price_panel if price_panel is not None else worker_price_panel()
+    weight_matrix = strategy_class(**parameters).generate_weight_matrix(panel.prices)
+    full_result = VectorizedBacktest(panel, rebalancing_calendar).run_weight_matrix(weight_matrix, initial_nav,
+                                                                                    execution_cost_model)
+
+    # target weights of every rebalancing date (NaN forward filled), NaN on the other dates
+    rebalancing_mask = rebalancing_calendar.rebalancing_mask(panel.timestamps)
+    rebalancing_mask[0] = True
+    rebalancing_rows = np.flatnonzero(rebalancing_mask)
+    target_weights = np.full(weight_matrix.shape, np.nan)
+    target_weights[rebalancing_rows] = full_result.weights
+
+    def held_weights(row: int) -> np.ndarray:
+        """Weights held on row before trading: targets of the previous rebalancing drifted with prices."""
+        segment = np.searchsorted(rebalancing_rows, row, side='left') - 1
+        if segment < 0:
+            return np.zeros(weight_matrix.shape[1])
+        start_row = rebalancing_rows[segment]
+        # the targets were bought with the NAV before the execution costs, paid from the cash
+        invested_nav = full_result.nav[start_row] + full_result.execution_costs[segment]
+        holdings = full_result.weights[segment] * invested_nav * panel.prices[row] / panel.prices[start_row]
+        return holdings / full_result.nav[row]
+
+    def backtest(start_row: int, end_row: int):
+        initial_weights = held_weights(start_row)
+        window_weights = target_weights[start_row:end_row].copy()
+        if not rebalancing_mask[start_row]:
+            window_weights[0] = initial_weights  # no trade on the first date
+        window_rows = rebalancing_rows[(rebalancing_rows >= start_row) & (rebalancing_rows < end_row)]
+        window_calendar = RebalancingCalendar(panel.dates[window_rows])
+        # each window invests the NAV the whole-panel backtest has on its first date
+        return VectorizedBacktest(panel.slice(start_row, end_row), window_calendar).run_weight_matrix(
+            window_weights, full_result.nav[start_row], execution_cost_model, initial_weights)
+
+    scores, test_results = [], []
+    for train_start, train_end, test_start, test_end in windows:
+        scores.append(performance_metrics(backtest(train_start, train_end))[objective])
+        # the test backtest starts on the last train date, so that its first return is the one of the first test date
+        test_results.append(backtest(test_start - 1, test_end))
+    return {'parameters': parameters, 'scores': np.array(scores, dtype=np.float64), 'test_results': test_results}
+
+
+class WalkForwardScheduler:
+    """
+    Walk-forward optimisation of the parameters of a strategy: the history is cut in windows of train_length dates
+    followed by test_length dates, moved forward by step dates (test_length by default). On each window, the parameter
+    set of the grid with the best objective on the train dates is selected and backtested on the test dates; the returns
+    of the test windows chained together give the out-of-sample NAV, starting at 1 on the last date of the first train
+    window. A change of parameters between two windows is not charged execution costs.
+
+    All the windows use slices of the same price panel, and the weight matrix of each parameter set is computed once on
+    the whole history (row t only uses prices up to t, so no window looks ahead). The parameter sets are independent and
+    are evaluated on all the windows in a process pool sharing the price panel (shared_price_panel_executor).
+    initial_nav is the amount invested on the first date, which the costs of SquareRootMarketImpactCost depend on.
+    """
+
+    def __init__(self, strategy_class, parameter_grid: dict[str, list], price_panel: PricePanel, train_length: int,
+                 test_length: int, step: int = None, rebalancing_calendar: RebalancingCalendar = None,
+                 execution_cost_model: ExecutionCostModel = None, objective: str = 'sharpe_ratio',
+                 max_workers: int = None, initial_nav: float = 1.0):
+        self.strategy_class = strategy_class
+        self.parameter_grid = parameter_grid
+        self.price_panel = price_panel.slice(price_panel.first_complete_row())
+        self.train_length = train_length
+        self.test_length = test_length
+        self.step = step if step is not None else test_length
+        self.rebalancing_calendar = rebalancing_calendar if rebalancing_calendar is not None else RebalancingCalendar()
+        self.execution_cost_model = execution_cost_model
+        self.objective = objective
+        self.max_workers = max_workers if max_workers is not None else os.cpu_count()
+        self.initial_nav = initial_nav
+
+    def windows(self) -> list[tuple[int, int, int, int]]:
+        """Rows (train_start, train_end, test_start, test_end) of each window, end rows excluded."""
+        windows = []
+        train_start = 0
+        while train_start + self.train_length + self.test_length <= len(self.price_panel):
+            test_start = train_start + self.train_length
+            windows.append((train_start, test_start, test_start, test_start + self.test_length))
+            train_start += self.step
+        if not windows:
+            raise ValueError("The price panel is shorter than train_length + test_length.")
+        return windows
+
+    def run(self) -> WalkForwardResult:
+        windows = self.windows()
+        parameter_sets = ParameterSweep(self.strategy_class, self.parameter_grid, self.price_panel).parameter_sets()
+        arguments = (windows, self.rebalancing_calendar, self.execution_cost_model, self.objective, self.initial_nav)
+        if self.max_workers <= 1:
+            evaluations = [_evaluate_parameters(self.strategy_class, parameters, *arguments, self.price_panel)
+                           for parameters in parameter_sets]
+        else:
+            with shared_price_panel_executor(self.price_panel, self.max_workers) as executor:
+                futures = [executor.submit(_evaluate_parameters, self.strategy_class, parameters, *arguments)
+                           for parameters in parameter_sets]
+                evaluations = [future.result() for future in futures]
+
+        # best parameter set of each window (NaN scores are never selected)
+        scores = np.vstack([evaluation['scores'] for evaluation in evaluations])
+        best = np.argmax(np.where(np.isnan(scores), -np.inf, scores), axis=0)
+
+        dates = self.price_panel.dates
+        rows, navs = [], [np.ones(1)]
+        for window_number, ((train_start, train_end, test_start, test_end), selected) in enumerate(zip(windows, best)):
+            evaluation = evaluations[selected]
+            test_result = evaluation['test_results'][window_number]
+            test_metrics = performance_metrics(test_result)
+            rows.append({'train_start': dates[train_start], 'train_end': dates[train_end - 1],
+                         'test_start': dates[test_start], 'test_end': dates[test_end - 1], **evaluation['parameters'],
+                         f'train_{self.objective}': scores[selected, window_number],
+                         **{f'test_{name}': value for name, value in test_metrics.items()}})
+            if self.step >= self.test_length or window_number == len(windows) - 1:
+                kept_length = self.test_length
+            else:
+                kept_length = self.step  # overlapping test windows: only the dates before the next window are kept
+            # the first NAV of the test backtest is the last train date, the previous window's last date
+            navs.append(navs[-1][-1] * test_result.nav[1:kept_length + 1] / test_result.nav[0])
+
+        first_row = windows[0][2] - 1
+        nav = np.concatenate(navs)
+        return WalkForwardResult(pd.DataFrame(rows), dates[first_row:first_row + len(nav)], nav)
+
+
+if __name__ == '__main__':
+    import time
+
+    from exercise.s4.s4_resources.execution_cost import FixedBpsCost
+    from exercise.s4.s4_resources.strategy import EqualWeightStrategy, MomentumStrategy
+
+    rng = np.random.default_rng(1)
+    dates = pd.bdate_range('2014-01-01', periods=2520)
+    df_prices = pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0.0002, 0.01, (len(dates), 200)), axis=0)),
+                             index=dates, columns=[f'TICKER_{i}' for i in range(200)])
+    price_panel = PricePanel.from_dataframe(df_prices)
+
+    scheduler = WalkForwardScheduler(MomentumStrategy, {'lookback_period': [10, 20, 50, 100, 200]}, price_panel,
+                                     train_length=504, test_length=126, rebalancing_calendar=RebalancingCalendar('W'),
+                                     execution_cost_model=FixedBpsCost(5))
+    start = time.perf_counter()
+    result = scheduler.run()
+    print(result.windows[['test_start', 'lookback_period', 'train_sharpe_ratio', 'test_sharpe_ratio']].to_string())
+    print(f"{len(result.windows)} windows x 5 parameter sets in {time.perf_counter() - start:.2f}s, "
+          f"out-of-sample final NAV {result.nav[-1]:.3f}")
+
+    # with one parameter set, the chained test windows give the NAV of one backtest over the same dates (exactly
+    # without costs; with costs up to the approximation of the drifted weights of VectorizedBacktest, cost x turnover)
+    for calendar, cost_model in [(RebalancingCalendar('W'), None), (RebalancingCalendar(7), None),
+                                 (RebalancingCalendar('W'), FixedBpsCost(5))]:
+        for strategy_class, parameters in [(EqualWeightStrategy, {}), (MomentumStrategy, {'lookback_period': 20})]:
+            chained = WalkForwardScheduler(strategy_class, {name: [value] for name, value in parameters.items()},
+                                           price_panel, train_length=100, test_length=100,
+                                           rebalancing_calendar=calendar, execution_cost_model=cost_model,
+                                           max_workers=1).run()
+            full_nav = VectorizedBacktest(price_panel, calendar).run(strategy_class(**parameters),
+                                                                     execution_cost_model=cost_model).nav
+            full_nav = full_nav[99:99 + len(chained.nav)] / full_nav[99]
+            print(f"{strategy_class.__name__}, calendar {calendar.frequency}, costs {cost_model is not None}: max "
+                  f"relative difference with one backtest {np.max(np.abs(chained.nav / full_nav - 1)):.2e}")
@@ -0,0 +1,212 @@
+import asyncio
+import random
+from abc import ABC, abstractmethod
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+import pandas as pd
+
+from exercise.s5.corrected_version.s5_data_loader_corrected_version import MarketDataDownloadError
+
+"""
+pip install aiohttp
+
+Asynchronous counterpart of the YahooFinanceDataLoader and of the CoinGecko / Binance calls of crypto_index_helper.py.
+
+Each provider loader owns:
+    - one aiohttp session (and so one pool of connections) reused for every request to the provider
+    - one token bucket limiting the number of requests per second sent to the provider
+    - a retry policy with exponential backoff for rate limit answers (429), server errors and connection errors; a
+      429 answer with a Retry-After header is retried after the delay it asks for
+
+Loaders are used as asynchronous context managers and fetch many symbols at once with fetch_many:
+
+    async with AsyncBinanceLoader() as loader:
+        histories = await loader.fetch_many(['BTCUSDT', 'ETHUSDT'], start_date=datetime(2023, 1, 1))
+
+Dates without a time zone are read as UTC, the time zone of the provider APIs, whatever the local time zone.
+"""
+
+
+def _utc_timestamp(date: datetime) -> float:
+    """POSIX timestamp of a datetime, a naive datetime being read as UTC."""
+    if date.tzinfo is None:
+        date = date.replace(tzinfo=timezone.utc)
+    return date.timestamp()
+
+
+class TokenBucket:
+    """Token bucket rate limiter: `rate` tokens are added per second, up to `capacity` tokens."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._last_refill = None
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            loop = asyncio.get_running_loop()
+            while True:
+                now = loop.time()
+                if self._last_refill is not None:
+                    self._tokens = min(self.capacity, self._tokens + (now - self._last_refill) * self.rate)
+                self._last_refill = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncMarketDataLoader(ABC):
+    base_url: str = ''
+    requests_per_second: float = 5
+    burst: int = 5
+    max_connections: int = 10
+    retry_status = (429, 500, 502, 503, 504)
+
+    def __init__(self, base_url: str = None, max_retries: int = 3, backoff_seconds: float = 0.5):
+        if base_url is not None:
+            self.base_url = base_url
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.rate_limiter = TokenBucket(self.requests_per_second, self.burst)
+        self._session: aiohttp.ClientSession | None = None
+
+    async def __aenter__(self):
+        connector = aiohttp.TCPConnector(limit=self.max_connections)
+        self._session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=30))
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self._session.close()
+        self._session = None
+
+    async def _get_json(self, path: str, params: dict = None):
+        """GET request on the provider with rate limiting and retries. Raises MarketDataDownloadError when all the
+        attempts failed."""
+        if self._session is None:
+            raise RuntimeError(f"{type(self).__name__} must be used with 'async with'.")
+        url = self.base_url + path
+        for attempt in range(self.max_retries + 1):
+            await self.rate_limiter.acquire()
+            retry_after = None
+            try:
+                async with self._session.get(url, params=params) as response:
+                    if response.status not in self.retry_status:
+                        response.raise_for_status()
+                        return await response.json()
+                    if response.status == 429:
+                        retry_after = self.parse_retry_after(response.headers.get('Retry-After'))
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                pass
+            except aiohttp.ClientResponseError:
+                break
+            if attempt < self.max_retries:
+                if retry_after is None:
+                    retry_after = self.backoff_seconds * 2 ** attempt * (1 + random.random() / 10)
+                await asyncio.sleep(retry_after)
+        raise MarketDataDownloadError(type(self), '_get_json', path, params)
+
+    @staticmethod
+    def parse_retry_after(value: str | None) -> float | None:
+        """Delay in seconds of a Retry-After header (a number of seconds or an HTTP date), None if absent or invalid."""
+        if value is None:
+            return None
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+        try:
+            retry_date = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        if retry_date.tzinfo is None:
+            retry_date = retry_date.replace(tzinfo=timezone.utc)
+        return max((retry_date - datetime.now(timezone.utc)).total_seconds(), 0.0)
+
+    @abstractmethod
+    async def fetch(self, symbol: str, **kwargs):
+        """Downloads the data of one symbol from the provider."""
+        pass
+
+    async def fetch_many(self, symbols: list[str], return_exceptions: bool = False, **kwargs) -> dict:
+        """
+        Downloads the data of several symbols concurrently (bounded by the rate limiter and the connection pool).
+
+        Returns:
+        - A dictionary with symbols as keys and fetched data (or the raised exception if return_exceptions) as values.
+        """
+        results = await asyncio.gather(*(self.fetch(symbol, **kwargs) for symbol in symbols),
+                                       return_exceptions=return_exceptions)
+        return dict(zip(symbols, results))
+
+
+class AsyncYahooFinanceLoader(AsyncMarketDataLoader):
+    base_url = 'https://query1.finance.yahoo.com'
+    requests_per_second = 2
+    burst = 5
+
+    async def fetch(self, symbol: str, start_date: datetime = None, end_date: datetime = None) -> pd.DataFrame:
+        """Daily price history of a Yahoo ticker, with the same 'Close' column as YahooFinanceDataLoader."""
+        params = {'interval': '1d',
+                  'period1': int(_utc_timestamp(start_date)) if start_date else 0,
+                  'period2': int(_utc_timestamp(end_date or datetime.now(timezone.utc)))}
+        data = await self._get_json(f'/v8/finance/chart/{symbol}', params)
+        try:
+            result = data['chart']['result'][0]
+            quote = result['indicators']['quote'][0]
+            index = pd.to_datetime(result['timestamp'], unit='s', utc=True).rename('Date')
+            columns = {column.capitalize(): quote[column] for column in ('open', 'high', 'low', 'close', 'volume')}
+            return pd.DataFrame(columns, index=index)
+        except (KeyError, IndexError, TypeError):
+            raise MarketDataDownloadError(type(self), 'fetch', symbol)
+
+
+class AsyncCoinGeckoLoader(AsyncMarketDataLoader):
+    base_url = 'https://api.coingecko.com/api/v3'
+    requests_per_second = 0.5
+    burst = 3
+
+    async def fetch(self, symbol: str) -> dict:
+        """Same data as CoinGeckoAPI().get_coin_by_id(symbol)."""
+        return await self._get_json(f'/coins/{symbol}', {'localization': 'false'})
+
+
+class AsyncBinanceLoader(AsyncMarketDataLoader):
+    base_url = 'https://api.binance.com'
+    requests_per_second = 10
+    burst = 20
+    klines_limit = 1000
+    columns = ['Open time', 'Open', 'High', 'Low', 'Close', 'Volume', 'Close time', 'Quote asset volume',
+               'Number of trades', 'Taker buy base asset volume', 'Taker buy quote asset volume', 'Ignore']
+    numeric_columns = ['Open', 'High', 'Low', 'Close', 'Volume', 'Quote asset volume', 'Number of trades',
+                       'Taker buy base asset volume', 'Taker buy quote asset volume']
+
+    async def fetch(self, symbol: str, start_date: datetime = None, end_date: datetime = None,
+                    interval: str = '1d') -> pd.DataFrame:
+        """Klines of a pair, paginated like Client.get_historical_klines_generator, formatted as in
+        crypto_index_helper.py."""
+        start_ms = int(_utc_timestamp(start_date) * 1000) if start_date else 0
+        end_ms = int(_utc_timestamp(end_date or datetime.now(timezone.utc)) * 1000)
+        k_lines = []
+        while start_ms < end_ms:
+            params = {'symbol': symbol, 'interval': interval, 'startTime': start_ms, 'endTime': end_ms,
+                      'limit': self.klines_limit}
+            page = await self._get_json('/api/v3/klines', params)
+            if not page:
+                break
+            k_lines.extend(page)
+            start_ms = page[-1][6] + 1
+            if len(page) < self.klines_limit:
+                break
+
+        df = pd.DataFrame(k_lines, columns=self.columns)
+        df['Open time'] = pd.to_datetime(df['Open time'], unit='ms')
+        df['Close time'] = pd.to_datetime(df['Close time'], unit='ms')
+        df.drop(columns=['Ignore'], inplace=True)
+        df[self.numeric_columns] = df[self.numeric_columns].apply(pd.to_numeric, errors='coerce')
+        return df
+
@@ -0,0 +1,5 @@
+"""
+Constants shared by the fund analysis scripts.
+"""
+
+TRADING_DAYS = 252  # periods per year used to annualize daily statistics
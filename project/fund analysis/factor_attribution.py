@@ -0,0 +1,224 @@
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.linalg import solve_triangular
+
+from fund_data_reader import FundDataReaderRegistry
+
+"""
+Factor attribution of fund NAVs: the fund returns in excess of the risk-free rate are regressed on factor returns
+(e.g. the Betting Against Beta workbook: MKT, SMB, HML FF, HML Devil, UMD with RF as risk-free rate).
+
+All the funds are regressed on the same factor matrix, so the work on the factor side is done once: the QR
+decomposition of the design matrix [1, factors] is cached for each set of dates, and the coefficients of many funds
+are obtained with one triangular solve on a matrix of returns. The rolling regressions use recursive least squares,
+whose gain only depends on the factors and is shared by all the funds of a group.
+"""
+
+
+def group_columns_by_dates(valid: np.ndarray):
+    """
+    Groups the columns of a (dates x series) boolean matrix with identical valid dates.
+
+    Yields: (rows, columns) for each group, rows being the boolean mask of the valid dates of the group.
+    """
+    patterns, groups = np.unique(np.packbits(valid, axis=0), axis=1, return_inverse=True)
+    groups = groups.ravel()
+    for group in range(patterns.shape[1]):
+        columns = np.flatnonzero(groups == group)
+        yield valid[:, columns[0]], columns
+
+
+class FactorMatrixDecomposition:
+    """QR decomposition of a design matrix, solving the least squares problem of any number of right-hand sides."""
+
+    def __init__(self, design: np.ndarray):
+        self.design = design
+        self.q, self.r = np.linalg.qr(design)
+
+    def solve(self, y: np.ndarray) -> np.ndarray:
+        """Coefficients (factors x series) minimizing ||design @ coefficients - y|| for y of shape (dates x series)."""
+        return solve_triangular(self.r, self.q.T @ y)
+
+    def normal_matrix_inverse(self) -> np.ndarray:
+        """(X'X)^-1 = R^-1 R'^-1, the starting covariance of the recursive least squares."""
+        r_inverse = solve_triangular(self.r, np.eye(self.r.shape[0]))
+        return r_inverse @ r_inverse.T
+
+
+class FactorAttribution:
+    """
+    Regressions of fund excess returns on factor returns, for many funds at once.
+
+    Parameters:
+    - factor_levels: factor index levels (as read by AqrFactorExcelReader), resampled to `frequency`.
+    - frequency: pandas frequency of the regressions; the daily fund NAVs are resampled to it (last NAV of the period).
+    - risk_free_factor: column of factor_levels giving the risk-free returns, subtracted from the fund returns and not
+      used as a regressor (ignored when absent).
+    - periods_per_year: used to annualize the alphas and residual volatilities.
+    """
+
+    def __init__(self, factor_levels: pd.DataFrame, frequency: str = 'ME', risk_free_factor: str = 'RF',
+                 periods_per_year: int = 12):
+        self.frequency = frequency
+        self.periods_per_year = periods_per_year
+        factor_returns = factor_levels.resample(frequency).last().pct_change(fill_method=None).iloc[1:]
+        self.risk_free_returns = None
+        if risk_free_factor in factor_returns.columns:
+            self.risk_free_returns = factor_returns[risk_free_factor]
+            factor_returns = factor_returns.drop(columns=risk_free_factor)
+        self.factor_returns = factor_returns
+        self.factor_names = list(factor_returns.columns)
+        self.coefficient_names = ['factor_alpha'] + [f'loading_{name}' for name in self.factor_names]
+        self._decompositions: dict[bytes, FactorMatrixDecomposition] = {}
+
+    def excess_returns(self, nav_panel: pd.DataFrame) -> pd.DataFrame:
+        """Fund returns at the factor frequency, in excess of the risk-free rate, on the dates of the factor returns."""
+        navs = nav_panel.resample(self.frequency).last()
+        returns = navs.pct_change(fill_method=None).reindex(self.factor_returns.index)
+        if self.risk_free_returns is not None:
+            returns = returns.sub(self.risk_free_returns, axis=0)
+        return returns
+
+    def design_matrix(self) -> np.ndarray:
+        return np.column_stack([np.ones(len(self.factor_returns)), self.factor_returns.to_numpy(dtype=np.float64)])
+
+    def decomposition(self, rows: np.ndarray) -> FactorMatrixDecomposition:
+        """Cached decomposition of the design matrix restricted to the dates of the boolean mask rows."""
+        key = np.packbits(rows).tobytes()
+        if key not in self._decompositions:
+            self._decompositions[key] = FactorMatrixDecomposition(self.design_matrix()[rows])
+        return self._decompositions[key]
+
+    def _valid_returns(self, nav_panel: pd.DataFrame) -> (np.ndarray, np.ndarray):
+        returns = self.excess_returns(nav_panel).to_numpy(dtype=np.float64)
+        valid = ~np.isnan(returns) & ~np.isnan(self.design_matrix()).any(axis=1)[:, None]
+        return returns, valid
+
+    def fit(self, nav_panel: pd.DataFrame) -> pd.DataFrame:
+        """
+        Full sample OLS of every fund of the panel (dates x funds).
+
+        Returns: A DataFrame with one row per fund: annualized alpha, factor loadings, R², annualized residual
+        volatility and number of observations.
+        """
+        returns, valid = self._valid_returns(nav_panel)
+        n_coefficients = len(self.coefficient_names)
+        coefficients = np.full((n_coefficients, returns.shape[1]), np.nan)
+        r_squared = np.full(returns.shape[1], np.nan)
+        residual_volatility = np.full(returns.shape[1], np.nan)
+        for rows, columns in group_columns_by_dates(valid):
+            n_observations = rows.sum()
+            if n_observations <= n_coefficients:
+                continue
+            decomposition = self.decomposition(rows)
+            y = returns[rows][:, columns]
+            solution = decomposition.solve(y)
+            residuals = y - decomposition.design @ solution
+            coefficients[:, columns] = solution
+            residual_sum = (residuals ** 2).sum(axis=0)
+            r_squared[columns] = 1 - residual_sum / ((y - y.mean(axis=0)) ** 2).sum(axis=0)
+            residual_volatility[columns] = np.sqrt(residual_sum / (n_observations - n_coefficients))
+
+        coefficients[0] *= self.periods_per_year
+        table = dict(zip(self.coefficient_names, coefficients))
+        table['factor_r_squared'] = r_squared
+        table['residual_volatility'] = residual_volatility * np.sqrt(self.periods_per_year)
+        table['factor_observations'] = valid.sum(axis=0)
+        return pd.DataFrame(table, index=pd.Index(nav_panel.columns, name='Series'))
+
+    def rolling_fit(self, nav_panel: pd.DataFrame, window: int) -> dict[str, pd.DataFrame]:
+        """
+        Rolling OLS over the last `window` valid periods of each fund, by recursive least squares: each new period is
+        added to and the oldest removed from the coefficients of all the funds sharing the same dates with one shared
+        gain vector (Sherman-Morrison updates of (X'X)^-1). The coefficients are recomputed from the normal equations
+        every `window` periods so that the rounding errors do not accumulate.
+
+        Returns: A dictionary with the coefficient names of fit as keys and DataFrames (dates x funds) as values, NaN
+        until a fund has `window` valid periods. Alphas are annualized.
+        """
+        returns, valid = self._valid_returns(nav_panel)
+        design = self.design_matrix()
+        n_coefficients = len(self.coefficient_names)
+        if window <= n_coefficients:
+            raise ValueError("The window must be longer than the number of coefficients.")
+        history = np.full((len(returns), n_coefficients, returns.shape[1]), np.nan)
+
+        for rows, columns in group_columns_by_dates(valid):
+            row_numbers = np.flatnonzero(rows)
+            if len(row_numbers) < window:
+                continue
+            x, y = design[row_numbers], returns[row_numbers][:, columns]
+            covariance, coefficients = None, None
+            for end in range(window, len(row_numbers) + 1):
+                if (end - window) % window == 0:
+                    decomposition = FactorMatrixDecomposition(x[end - window:end])
+                    coefficients = decomposition.solve(y[end - window:end])
+                    covariance = decomposition.normal_matrix_inverse()
+                else:
+                    covariance, coefficients = self._rls_update(covariance, coefficients, x[end - 1], y[end - 1], 1.0)
+                    covariance, coefficients = self._rls_update(covariance, coefficients, x[end - window - 1],
+                                                                y[end - window - 1], -1.0)
+                history[row_numbers[end - 1], :, columns] = coefficients.T
+
+        history[:, 0] *= self.periods_per_year
+        dates = self.factor_returns.index
+        return {name: pd.DataFrame(history[:, i], index=dates, columns=nav_panel.columns)
+                for i, name in enumerate(self.coefficient_names)}
+
+    @staticmethod
+    def _rls_update(covariance: np.ndarray, coefficients: np.ndarray, x: np.ndarray, y: np.ndarray,
+                    sign: float) -> (np.ndarray, np.ndarray):
+        """Adds (sign=1) or removes (sign=-1) one period (factor row x, fund returns y) from the least squares fit."""
+        covariance_x = covariance @ x
+        gain = covariance_x / (1 + sign * (x @ covariance_x))
+        coefficients = coefficients + sign * np.outer(gain, y - x @ coefficients)
+        covariance = covariance - sign * np.outer(gain, covariance_x)
+        return covariance, coefficients
+
+
+if __name__ == '__main__':
+    import time
+
+    from performance_report import align_nav_panel
+
+    fund_folder = os.path.dirname(os.path.abspath(__file__))
+    data = FundDataReaderRegistry.load_folder(fund_folder)
+    attribution = FactorAttribution(data.pop('Betting Against Beta Equity Factors Monthly'))
+    nav_panel = align_nav_panel(data)
+    with pd.option_context('display.width', 200, 'display.max_columns', 30):
+        print(attribution.fit(nav_panel).T)
+
+    # recursive least squares against a direct regression on each window
+    rolling = attribution.rolling_fit(nav_panel, window=36)
+    returns = attribution.excess_returns(nav_panel)
+    fund = nav_panel.columns[0]
+    valid_dates = returns.index[returns[fund].notna()]
+    last_window = valid_dates[-36:]
+    direct = np.linalg.lstsq(np.column_stack([np.ones(36), attribution.factor_returns.loc[last_window]]),
+                             returns.loc[last_window, fund], rcond=None)[0]
+    recursive = [rolling[name].loc[last_window[-1], fund] for name in attribution.coefficient_names]
+    print(f"rolling 36 months, last window: max difference to direct OLS "
+          f"{np.max(np.abs(np.array(recursive[1:]) - direct[1:])):.2e}")
+
+    # benchmark: 10,000 synthetic funds over 20 years of daily NAVs
+    n_funds = 10_000
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2004-01-01', '2023-12-31')
+    monthly_factors = attribution.factor_returns.loc['2004':'2023'].to_numpy()
+    loadings = rng.normal(0.3, 0.3, (monthly_factors.shape[1], n_funds))
+    month_numbers = dates.year * 12 + dates.month
+    first_day_of_month = np.r_[True, month_numbers[1:] != month_numbers[:-1]]
+    daily_returns = np.zeros((len(dates), n_funds))
+    daily_returns[first_day_of_month] = monthly_factors @ loadings
+    daily_returns += rng.normal(0, 0.002, daily_returns.shape)
+    synthetic_panel = pd.DataFrame(100 * np.cumprod(1 + daily_returns, axis=0), index=dates)
+
+    start = time.perf_counter()
+    attribution.fit(synthetic_panel)
+    fit_time = time.perf_counter() - start
+    start = time.perf_counter()
+    attribution.rolling_fit(synthetic_panel, window=36)
+    rolling_time = time.perf_counter() - start
+    print(f"{n_funds} funds: OLS {fit_time:.2f}s, rolling 36-month OLS {rolling_time:.2f}s")
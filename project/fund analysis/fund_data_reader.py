@@ -0,0 +1,256 @@
+import os
+from abc import ABC, abstractmethod
+
+import numpy as np
+import pandas as pd
+
+"""
+pip install openpyxl pyarrow
+
+The files of the fund analysis folder all come with their own layout (header rows, French headers, dd.mm.yyyy dates,
+comma decimals, newest-first rows, Excel workbooks...). Each FundDataReader knows one layout: it says whether it can
+read a file and returns the data in a single normalized format:
+    - a DataFrame indexed by a DatetimeIndex named 'Date', sorted in ascending order
+    - one float64 column per NAV series (a fund share class, an index or a factor)
+
+Factor returns are compounded into an index level so that every source can be handled as a NAV series. The result of
+the first parsing is cached as a parquet file in a .fund_cache folder next to the source file, so reloading a file
+(especially an Excel workbook) does not parse it again.
+"""
+
+CACHE_FOLDER_NAME = '.fund_cache'
+
+
+class FundDataFormatError(Exception):
+    """ Raised when no registered reader is able to read a fund data file """
+    pass
+
+
+class FundDataReader(ABC):
+    extensions: tuple = ()
+
+    @abstractmethod
+    def can_read(self, file_path: str) -> bool:
+        """
+        Checks whether the file layout is the one handled by the reader.
+
+        Parameters:
+        - file_path: path of the file to check.
+
+        Returns:
+        - True if the reader can parse the file.
+        """
+        pass
+
+    @abstractmethod
+    def read(self, file_path: str) -> pd.DataFrame:
+        """
+        Parses the file and returns the NAV series in the normalized format.
+        """
+        pass
+
+    @staticmethod
+    def _read_first_line(file_path: str) -> str:
+        with open(file_path, 'r', encoding='utf-8-sig') as f:
+            return f.readline()
+
+    @staticmethod
+    def _parse_locale_numbers(values: pd.Series) -> pd.Series:
+        """Vectorized conversion of strings such as ' 436,5651' or '1 874.74' to float."""
+        cleaned = values.astype(str).str.replace(' ', '', regex=False).str.replace(' ', '', regex=False)
+        cleaned = cleaned.str.replace(',', '.', regex=False)
+        return pd.to_numeric(cleaned, errors='coerce').astype(np.float64)
+
+    @staticmethod
+    def _normalize(dates: pd.Series, values: pd.DataFrame) -> pd.DataFrame:
+        df = values.astype(np.float64)
+        df.index = pd.DatetimeIndex(dates, name='Date')
+        df = df[df.index.notna()]
+        df = df.dropna(how='all')
+        df = df[~df.index.duplicated(keep='last')]
+        return df.sort_index()
+
+
+class FundDataReaderRegistry:
+    _readers: list[FundDataReader] = []
+
+    @classmethod
+    def register(cls, reader_class):
+        """Class decorator adding a reader to the registry. Readers are tried in registration order."""
+        cls._readers.append(reader_class())
+        return reader_class
+
+    @classmethod
+    def detect(cls, file_path: str) -> FundDataReader:
+        extension = os.path.splitext(file_path)[1].lower()
+        for reader in cls._readers:
+            if extension in reader.extensions and reader.can_read(file_path):
+                return reader
+        raise FundDataFormatError(f"No fund data reader found for file {file_path}")
+
+    @classmethod
+    def load(cls, file_path: str, use_cache: bool = True) -> pd.DataFrame:
+        """
+        Loads a fund data file in the normalized NAV format, going through the parquet cache when it is up to date.
+
+        Parameters:
+        - file_path: path of the fund data file.
+        - use_cache: if False, the file is parsed again and the cache is rewritten.
+
+        Returns:
+        - DataFrame indexed by 'Date' with one float column per NAV series.
+        """
+        cache_path = cls.cache_path(file_path)
+        if use_cache and os.path.exists(cache_path):
+            return pd.read_parquet(cache_path)
+
+        df_nav = cls.detect(file_path).read(file_path)
+        cache_folder, cache_name = os.path.split(cache_path)
+        os.makedirs(cache_folder, exist_ok=True)
+        # caches of previous versions of the file
+        file_prefix = os.path.basename(file_path) + '.'
+        for name in os.listdir(cache_folder):
+            if name.startswith(file_prefix) and name.endswith('.parquet') and name != cache_name:
+                os.remove(os.path.join(cache_folder, name))
+        df_nav.to_parquet(cache_path)
+        return df_nav
+
+    @classmethod
+    def load_folder(cls, folder_path: str, use_cache: bool = True) -> dict[str, pd.DataFrame]:
+        """Loads every readable file of a folder. Keys are the file names without extension."""
+        data = {}
+        for file_name in sorted(os.listdir(folder_path)):
+            file_path = os.path.join(folder_path, file_name)
+            if not os.path.isfile(file_path):
+                continue
+            try:
+                data[os.path.splitext(file_name)[0]] = cls.load(file_path, use_cache)
+            except FundDataFormatError:
+                continue
+        return data
+
+    @staticmethod
+    def cache_path(file_path: str) -> str:
+        """Cache file of a fund data file, keyed by its full name (with the extension), size and modification
+        time: a modified file gets a new cache file."""
+        folder, file_name = os.path.split(os.path.abspath(file_path))
+        stat = os.stat(file_path)
+        return os.path.join(folder, CACHE_FOLDER_NAME, f"{file_name}.{stat.st_size}-{stat.st_mtime_ns}.parquet")
+
+
+@FundDataReaderRegistry.register
+class AqrPriceHistoryReader(FundDataReader):
+    """AQR daily price history: an exported DataFrame with 'Unnamed:' headers, a title block and one
+    (NAV, Distrib., Adj. NAV) group of columns per share class. The Adj. NAV is kept as NAV series."""
+    extensions = ('.csv',)
+
+    def can_read(self, file_path: str) -> bool:
+        return self._read_first_line(file_path).startswith(',Unnamed: 0,Unnamed: 1')
+
+    def read(self, file_path: str) -> pd.DataFrame:
+        raw = pd.read_csv(file_path, header=None, skiprows=1, dtype=str)
+        header_row = raw.index[raw.eq('Date').any(axis=1)][0]
+        date_column = raw.columns[raw.loc[header_row].eq('Date')][0]
+        class_names = raw.loc[header_row - 1].ffill()
+        fund_name = raw.iloc[:header_row, date_column].dropna().iloc[0]
+
+        nav_columns = raw.columns[raw.loc[header_row].astype(str).str.startswith('Adj. NAV')]
+        body = raw.loc[header_row + 1:]
+        dates = pd.to_datetime(body[date_column], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+        values = body[nav_columns].apply(self._parse_locale_numbers)
+        values.columns = [f"{fund_name} {class_names[column]}" for column in nav_columns]
+        return self._normalize(dates, values)
+
+
+@FundDataReaderRegistry.register
+class FrenchNavCsvReader(FundDataReader):
+    """Fund provider export with French headers ('Date de valorisation', 'VL'), dd.mm.yyyy dates and comma
+    decimals."""
+    extensions = ('.csv',)
+
+    def can_read(self, file_path: str) -> bool:
+        first_line = self._read_first_line(file_path)
+        return 'Date de valorisation' in first_line and '"VL"' in first_line
+
+    def read(self, file_path: str) -> pd.DataFrame:
+        raw = pd.read_csv(file_path, dtype=str, encoding='utf-8-sig')
+        raw.columns = raw.columns.str.replace(' ', ' ').str.strip()
+        dates = pd.to_datetime(raw['Date de valorisation'], format='%d.%m.%Y', errors='coerce')
+        fund_name = raw["Nom de la classe d’actions"].dropna().iloc[0]
+        values = pd.DataFrame({fund_name: self._parse_locale_numbers(raw['VL'])})
+        return self._normalize(dates, values)
+
+
+@FundDataReaderRegistry.register
+class IndexTrackerCsvReader(FundDataReader):
+    """Index history with mm/dd/yyyy dates, newest first, and a 'Clôture/Dernier' close column."""
+    extensions = ('.csv',)
+
+    def can_read(self, file_path: str) -> bool:
+        first_line = self._read_first_line(file_path)
+        return first_line.startswith('Date,') and 'Clôture/Dernier' in first_line
+
+    def read(self, file_path: str) -> pd.DataFrame:
+        raw = pd.read_csv(file_path, dtype=str, encoding='utf-8-sig')
+        dates = pd.to_datetime(raw['Date'], format='%m/%d/%Y', errors='coerce')
+        series_name = os.path.splitext(os.path.basename(file_path))[0]
+        values = pd.DataFrame({series_name: self._parse_locale_numbers(raw['Clôture/Dernier'])})
+        return self._normalize(dates, values)
+
+
+@FundDataReaderRegistry.register
+class NavEvolutionExcelReader(FundDataReader):
+    """Excel export of a NAV evolution ('Evolution de la VL' sheet): title rows then a 'Date'/'VL' table with
+    dd.mm.yyyy dates."""
+    extensions = ('.xlsx',)
+    sheet_name = 'Evolution de la VL'
+
+    def can_read(self, file_path: str) -> bool:
+        return self.sheet_name in pd.ExcelFile(file_path).sheet_names
+
+    def read(self, file_path: str) -> pd.DataFrame:
+        raw = pd.read_excel(file_path, sheet_name=self.sheet_name, header=None, dtype=str)
+        header_row = raw.index[raw[0].eq('Date')][0]
+        fund_name = raw.iloc[1, 0]
+        body = raw.loc[header_row + 1:]
+        dates = pd.to_datetime(body[0], format='%d.%m.%Y', errors='coerce')
+        values = pd.DataFrame({fund_name: self._parse_locale_numbers(body[1])})
+        return self._normalize(dates, values)
+
+
+@FundDataReaderRegistry.register
+class AqrFactorExcelReader(FundDataReader):
+    """AQR factor workbook: one sheet per factor, a 'DATE' header row and monthly returns per region. The returns of
+    the selected region are compounded into an index: the level of the first month is 1 + its return, so that
+    every return can be recovered from the levels."""
+    extensions = ('.xlsx',)
+    factor_sheets = ('MKT', 'SMB', 'HML FF', 'HML Devil', 'UMD', 'RF')
+
+    def __init__(self, region: str = 'USA'):
+        self.region = region
+
+    def can_read(self, file_path: str) -> bool:
+        return set(self.factor_sheets).issubset(pd.ExcelFile(file_path).sheet_names)
+
+    def read(self, file_path: str) -> pd.DataFrame:
+        sheets = pd.read_excel(file_path, sheet_name=list(self.factor_sheets), header=None)
+        factor_levels = []
+        for sheet_name, raw in sheets.items():
+            header_row = raw.index[raw[0].eq('DATE')][0]
+            header = raw.loc[header_row]
+            value_column = header.index[header.eq(self.region)][0] if header.eq(self.region).any() else 1
+            body = raw.loc[header_row + 1:]
+            dates = pd.to_datetime(body[0], format='%m/%d/%Y', errors='coerce')
+            returns = self._parse_locale_numbers(body[value_column])
+            levels = pd.DataFrame({sheet_name: returns.values}, index=pd.DatetimeIndex(dates, name='Date'))
+            levels = levels[levels.index.notna()].dropna()
+            factor_levels.append((1 + levels).cumprod())
+        df = pd.concat(factor_levels, axis=1)
+        return self._normalize(df.index.to_series(), df)
+
+
+if __name__ == '__main__':
+    fund_folder = os.path.dirname(os.path.abspath(__file__))
+    for name, df_nav in FundDataReaderRegistry.load_folder(fund_folder).items():
+        print(name, df_nav.shape, df_nav.index.min().date(), df_nav.index.max().date())
+        print(df_nav.tail(2))
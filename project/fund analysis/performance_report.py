@@ -0,0 +1,161 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from calendar_alignment import CalendarAlignment
+from constants import TRADING_DAYS
+from factor_attribution import FactorAttribution
+from fund_data_reader import FundDataReaderRegistry
+
+"""
+Performance report of many NAV series at once. The NAV panel (dates x series, as built by align_nav_panel from the
+frames of FundDataReaderRegistry) is turned into a return matrix and every statistic is computed for all the columns
+with array operations: masked sums for the series that do not cover the same dates, and the batched regressions of
+FactorAttribution for the factor loadings.
+
+Each series keeps its own valuation dates: a return goes from one NAV of the series to its next NAV, so the dates
+where only the other series have a NAV add no (zero) return to its statistics.
+"""
+
+
+def align_nav_panel(navs: dict[str, pd.DataFrame] | list[pd.DataFrame]) -> pd.DataFrame:
+    """
+    Joins NAV frames on the union of their dates (CalendarAlignment). Each series only has values on its own dates:
+    the dates of the other series (holidays of its own calendar) are left NaN instead of forward filled.
+    """
+    sources = navs if isinstance(navs, dict) else dict(enumerate(navs))
+    return CalendarAlignment.from_sources(sources).panel(fill=False)
+
+
+def _previous_rows(levels: np.ndarray) -> np.ndarray:
+    """For each date after the first and each column, last earlier row with a value, -1 if none."""
+    row_numbers = np.arange(len(levels))[:, None]
+    last_valid_rows = np.maximum.accumulate(np.where(np.isnan(levels), -1, row_numbers), axis=0)
+    return last_valid_rows[:-1]
+
+
+def _returns_since(levels: np.ndarray, previous_rows: np.ndarray) -> np.ndarray:
+    """
+    Returns of each column of levels (dates x columns, or dates for a single series) from previous_rows to each date
+    after the first, NaN where there is no previous row.
+    """
+    columns = np.arange(previous_rows.shape[1])
+    previous_levels = levels[np.maximum(previous_rows, 0), columns] if levels.ndim == 2 else \
+        levels[np.maximum(previous_rows, 0)]
+    current_levels = levels[1:] if levels.ndim == 2 else levels[1:, None]
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.where(previous_rows >= 0, current_levels / previous_levels - 1, np.nan)
+
+
+class PerformanceReport:
+    """
+    Builds one table with a row per NAV series and a column per statistic:
+    - start, end, observations, total and annualized return, annualized volatility, Sharpe and Sortino ratios, max
+      drawdown, on the returns of the panel frequency;
+    - beta and annualized (Jensen) alpha to a benchmark NAV, on the dates shared with the benchmark;
+    - loadings, annualized alpha, R² and residual volatility of the regression of the excess returns on factor returns
+      at factor_frequency (FactorAttribution.fit).
+    """
+
+    def __init__(self, nav_panel: pd.DataFrame, benchmark: pd.Series = None, factors: pd.DataFrame = None,
+                 risk_free_rate: float = 0.0, periods_per_year: int = TRADING_DAYS, factor_frequency: str = 'ME',
+                 factor_periods_per_year: int = 12, risk_free_factor: str = 'RF'):
+        self.nav_panel = nav_panel
+        self.benchmark = benchmark
+        self.factors = factors
+        self.periods_per_year = periods_per_year
+        self.periodic_risk_free_rate = (1 + risk_free_rate) ** (1 / periods_per_year) - 1
+        self.factor_frequency = factor_frequency
+        self.factor_periods_per_year = factor_periods_per_year
+        self.risk_free_factor = risk_free_factor
+
+    def build(self) -> pd.DataFrame:
+        report = self._return_statistics()
+        if self.benchmark is not None:
+            report = report.join(self._benchmark_statistics())
+        if self.factors is not None:
+            report = report.join(self._factor_regressions())
+        return report
+
+    def _return_statistics(self) -> pd.DataFrame:
+        navs = self.nav_panel.to_numpy(dtype=np.float64)
+        columns = np.arange(navs.shape[1])
+        has_nav = ~np.isnan(navs)
+        first_rows = has_nav.argmax(axis=0)
+        last_rows = len(navs) - 1 - has_nav[::-1].argmax(axis=0)
+
+        returns = _returns_since(navs, _previous_rows(navs))
+        valid = ~np.isnan(returns)
+        count = valid.sum(axis=0)
+        excess_returns = np.where(valid, returns - self.periodic_risk_free_rate, 0.0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean = np.where(valid, returns, 0.0).sum(axis=0) / count
+            volatility = np.sqrt((np.where(valid, returns - mean, 0.0) ** 2).sum(axis=0) / (count - 1))
+            downside_deviation = np.sqrt((np.minimum(excess_returns, 0.0) ** 2).sum(axis=0) / count)
+            excess_mean = excess_returns.sum(axis=0) / count
+            total_return = navs[last_rows, columns] / navs[first_rows, columns] - 1
+            annualized_return = (1 + total_return) ** (self.periods_per_year / count) - 1
+            max_drawdown = np.nanmax(1 - navs / np.fmax.accumulate(navs, axis=0), axis=0)
+
+        annualization = np.sqrt(self.periods_per_year)
+        return pd.DataFrame({
+            'start': self.nav_panel.index[first_rows], 'end': self.nav_panel.index[last_rows], 'observations': count,
+            'total_return': total_return, 'annualized_return': annualized_return,
+            'annualized_volatility': volatility * annualization,
+            'sharpe_ratio': excess_mean / volatility * annualization,
+            'sortino_ratio': excess_mean / downside_deviation * annualization,
+            'max_drawdown': max_drawdown,
+        }, index=pd.Index(self.nav_panel.columns, name='Series'))
+
+    def _benchmark_statistics(self) -> pd.DataFrame:
+        benchmark_levels = self.benchmark.reindex(self.nav_panel.index.union(self.benchmark.index)).ffill()
+        benchmark_levels = benchmark_levels.reindex(self.nav_panel.index).to_numpy(dtype=np.float64)
+        navs = self.nav_panel.to_numpy(dtype=np.float64)
+        previous_rows = _previous_rows(navs)
+        # the benchmark return of each series covers the same period as its return, from its previous NAV date
+        returns = _returns_since(navs, previous_rows) - self.periodic_risk_free_rate
+        benchmark_returns = _returns_since(benchmark_levels, previous_rows) - self.periodic_risk_free_rate
+
+        # masked moments: each series only uses the dates where it and the benchmark both have a return
+        valid = ~np.isnan(returns) & ~np.isnan(benchmark_returns)
+        x = np.where(valid, returns, 0.0)
+        b = np.where(valid, benchmark_returns, 0.0)
+        count = valid.sum(axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            mean_x = x.sum(axis=0) / count
+            mean_b = b.sum(axis=0) / count
+            covariance = (b * x).sum(axis=0) / count - mean_x * mean_b
+            benchmark_variance = (b ** 2).sum(axis=0) / count - mean_b ** 2
+            beta = covariance / benchmark_variance
+            alpha = (mean_x - beta * mean_b) * self.periods_per_year
+        return pd.DataFrame({'beta': beta, 'alpha': alpha}, index=pd.Index(self.nav_panel.columns, name='Series'))
+
+    def _factor_regressions(self) -> pd.DataFrame:
+        attribution = FactorAttribution(self.factors, self.factor_frequency, self.risk_free_factor,
+                                        self.factor_periods_per_year)
+        return attribution.fit(self.nav_panel)
+
+if __name__ == '__main__':
+    import time
+
+    fund_folder = os.path.dirname(os.path.abspath(__file__))
+    data = FundDataReaderRegistry.load_folder(fund_folder)
+    benchmark = data.pop('S&P 500 tracker').iloc[:, 0]
+    factors = data.pop('Betting Against Beta Equity Factors Monthly')
+    nav_panel = align_nav_panel(data)
+    report = PerformanceReport(nav_panel, benchmark, factors, risk_free_rate=0.02).build()
+    with pd.option_context('display.width', 200, 'display.max_columns', 30):
+        print(report.T)
+
+    # benchmark: 10,000 synthetic daily NAV series over 10 years against the same benchmark and factors
+    n_dates, n_series = 2520, 10_000
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2014-10-09', periods=n_dates)
+    market_returns = benchmark.reindex(dates).ffill().bfill().pct_change().fillna(0.0).to_numpy()
+    series_returns = rng.uniform(0.5, 1.5, n_series) * market_returns[:, None] + \
+        rng.normal(0, 0.005, (n_dates, n_series))
+    synthetic_panel = pd.DataFrame(100 * np.cumprod(1 + series_returns, axis=0), index=dates)
+    start = time.perf_counter()
+    synthetic_report = PerformanceReport(synthetic_panel, benchmark, factors).build()
+    print(f"report of {n_series} series x {n_dates} dates: {time.perf_counter() - start:.2f}s")
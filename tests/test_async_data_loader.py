@@ -0,0 +1,149 @@
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from email.utils import format_datetime
+
+import numpy as np
+import pandas as pd
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+from exercise.s5.corrected_version.s5_async_data_loader import AsyncBinanceLoader, AsyncCoinGeckoLoader, \
+    AsyncMarketDataLoader, AsyncYahooFinanceLoader, TokenBucket
+from exercise.s5.corrected_version.s5_data_loader_corrected_version import MarketDataDownloadError
+
+
+@asynccontextmanager
+async def stub_server(routes: dict):
+    """Local HTTP server answering like the providers, yielding its base url."""
+    app = web.Application()
+    for path, handler in routes.items():
+        app.router.add_get(path, handler)
+    server = TestServer(app, host='127.0.0.1')
+    await server.start_server()
+    try:
+        yield str(server.make_url('')).rstrip('/')
+    finally:
+        await server.close()
+
+
+def yahoo_chart_response() -> web.Response:
+    quote = {'open': [1.0, 2.0], 'high': [1.5, 2.5], 'low': [0.5, 1.5], 'close': [1.2, 2.2], 'volume': [10, 20]}
+    result = {'timestamp': [1704153600, 1704240000], 'indicators': {'quote': [quote]}}
+    return web.json_response({'chart': {'result': [result]}})
+
+
+def test_429_is_retried_after_the_retry_after_delay():
+    calls = {}
+
+    async def yahoo_chart(request):
+        symbol = request.match_info['symbol']
+        calls.setdefault(symbol, []).append(asyncio.get_running_loop().time())
+        if len(calls[symbol]) == 1:
+            return web.json_response({}, status=429, headers={'Retry-After': '0.3'})
+        return yahoo_chart_response()
+
+    async def main():
+        async with stub_server({'/v8/finance/chart/{symbol}': yahoo_chart}) as url:
+            async with AsyncYahooFinanceLoader(url, backoff_seconds=0.01) as loader:
+                return await loader.fetch_many(['AAPL', 'MSFT'])
+
+    histories = asyncio.run(main())
+    assert {symbol: len(times) for symbol, times in calls.items()} == {'AAPL': 2, 'MSFT': 2}
+    assert all(times[1] - times[0] >= 0.3 for times in calls.values())
+    for df in histories.values():
+        assert df['Close'].tolist() == [1.2, 2.2]
+        assert df.index[0] == datetime(2024, 1, 2, tzinfo=timezone.utc)
+        assert list(df.columns) == ['Open', 'High', 'Low', 'Close', 'Volume']
+
+
+def test_server_errors_are_retried_then_raise():
+    calls = []
+
+    async def unavailable(request):
+        calls.append(request.path)
+        return web.json_response({}, status=503)
+
+    async def main():
+        async with stub_server({'/coins/{coin_id}': unavailable}) as url:
+            async with AsyncCoinGeckoLoader(url, max_retries=2, backoff_seconds=0.01) as loader:
+                await loader.fetch('bitcoin')
+
+    with pytest.raises(MarketDataDownloadError):
+        asyncio.run(main())
+    assert len(calls) == 3
+
+
+def test_requests_are_spaced_by_the_token_bucket():
+    acquire_times = []
+
+    class FastCoinGeckoLoader(AsyncCoinGeckoLoader):
+        requests_per_second = 20
+        burst = 1
+
+    async def coin_gecko_coin(request):
+        return web.json_response({'id': request.match_info['coin_id']})
+
+    async def main():
+        async with stub_server({'/coins/{coin_id}': coin_gecko_coin}) as url:
+            async with FastCoinGeckoLoader(url) as loader:
+                acquire = loader.rate_limiter.acquire
+
+                async def timed_acquire():
+                    await acquire()
+                    acquire_times.append(asyncio.get_running_loop().time())
+
+                loader.rate_limiter.acquire = timed_acquire
+                return await loader.fetch_many(['bitcoin', 'ethereum', 'solana', 'cardano', 'tether', 'ripple'])
+
+    coins = asyncio.run(main())
+    assert coins['solana'] == {'id': 'solana'}
+    spacings = np.diff(acquire_times)
+    assert len(acquire_times) == 6 and spacings.min() >= 1 / 20 - 1e-6
+
+
+def test_token_bucket_allows_a_burst_then_the_rate():
+    async def main():
+        bucket = TokenBucket(rate=10, capacity=3)
+        loop = asyncio.get_running_loop()
+        start = loop.time()
+        times = []
+        for _ in range(5):
+            await bucket.acquire()
+            times.append(loop.time() - start)
+        return times
+
+    times = asyncio.run(main())
+    assert times[2] < 0.05  # the first 3 tokens are available at once
+    assert times[3] >= 0.1 - 0.01 and times[4] >= 0.2 - 0.01
+
+
+def test_binance_klines_are_parsed():
+    async def binance_klines(request):
+        first = max(int(request.query['startTime']), 1704067200000)
+        day_ms = 86_400_000
+        return web.json_response([[first + i * day_ms, '1', '2', '0.5', str(1.5 + i), '100',
+                                   first + (i + 1) * day_ms - 1, '150', 10, '50', '75', '0'] for i in range(3)])
+
+    async def main():
+        async with stub_server({'/api/v3/klines': binance_klines}) as url:
+            async with AsyncBinanceLoader(url) as loader:
+                aware = await loader.fetch('BTCUSDT', start_date=datetime(2024, 1, 1, tzinfo=timezone.utc),
+                                           end_date=datetime(2024, 1, 3, tzinfo=timezone.utc))
+                naive = await loader.fetch('BTCUSDT', start_date=datetime(2024, 1, 1), end_date=datetime(2024, 1, 3))
+                return aware, naive
+
+    df, naive_df = asyncio.run(main())
+    pd.testing.assert_frame_equal(df, naive_df)  # naive dates are read as UTC
+    assert df['Close'].tolist() == [1.5, 2.5, 3.5]
+    assert df['Open time'].iloc[0] == datetime(2024, 1, 1)
+    assert 'Ignore' not in df.columns
+
+
+def test_parse_retry_after():
+    assert AsyncMarketDataLoader.parse_retry_after('2') == 2.0
+    assert AsyncMarketDataLoader.parse_retry_after(None) is None
+    assert AsyncMarketDataLoader.parse_retry_after('soon') is None
+    in_a_minute = format_datetime(datetime.now(timezone.utc) + timedelta(seconds=60), usegmt=True)
+    assert 55 < AsyncMarketDataLoader.parse_retry_after(in_a_minute) <= 60
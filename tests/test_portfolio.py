@@ -0,0 +1,81 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from exercise.s4.s4_resources.backtest import BacktestEngine, RebalancingCalendar
+from exercise.s4.s4_resources.execution_cost import FixedBpsCost
+from exercise.s4.s4_resources.instrument import Instrument
+from exercise.s4.s4_resources.portfolio import Portfolio
+from exercise.s4.s4_resources.position import Position
+from exercise.s4.s4_resources.price_panel import PricePanel
+from exercise.s4.s4_resources.quote import Quote
+from exercise.s4.s4_resources.strategy import EqualWeightStrategy, Strategy
+from exercise.s4.s4_resources.vectorized_backtest import VectorizedBacktest
+
+
+@pytest.fixture
+def df_prices() -> pd.DataFrame:
+    rng = np.random.default_rng(0)
+    dates = pd.bdate_range('2023-01-02', periods=120)
+    return pd.DataFrame(100 * np.exp(np.cumsum(rng.normal(0.0003, 0.01, (len(dates), 5)), axis=0)), index=dates,
+                        columns=[f'TICKER_{i}' for i in range(5)])
+
+
+def _default_portfolio(df_prices: pd.DataFrame, execution_cost_model=None) -> Portfolio:
+    """Portfolio whose positions are plain Position objects (no PortfolioState)."""
+    portfolio = Portfolio('default', 'USD', aum=1e6, nav=1e6, portfolio_strategy=EqualWeightStrategy(),
+                          execution_cost_model=execution_cost_model)
+    portfolio.positions = [Position(Instrument(ticker, 'XPAR', Quote(df_prices.index[-1], df_prices[ticker].iloc[-1]),
+                                               'USD')) for ticker in df_prices.columns]
+    return portfolio
+
+
+def test_default_portfolio_records_trades_and_costs(df_prices):
+    portfolio = _default_portfolio(df_prices, FixedBpsCost(bps=10))
+    portfolio.rebalance_portfolio(df_prices.index[-1])
+
+    quantities = np.array([position.quantity for position in portfolio.positions])
+    prices = df_prices.iloc[-1].to_numpy()
+    assert len(portfolio.last_trades) == len(df_prices.columns)
+    assert portfolio.last_rebalancing_cost == pytest.approx(quantities @ prices * 10 / 10_000)
+    assert portfolio.total_execution_cost == pytest.approx(portfolio.last_rebalancing_cost)
+
+
+def test_execution_costs_reduce_nav_of_default_portfolio(df_prices):
+    price_panel = PricePanel.from_dataframe(df_prices)
+    calendar = RebalancingCalendar('W')
+    nav_without_costs = BacktestEngine(_default_portfolio(df_prices), price_panel, calendar).run().nav
+
+    portfolio = _default_portfolio(df_prices, FixedBpsCost(bps=10))
+    nav_with_costs = BacktestEngine(portfolio, price_panel, calendar).run().nav
+
+    assert portfolio.total_execution_cost > 0
+    assert nav_with_costs[-1] < nav_without_costs[-1]
+    # same quantities on the first date: the NAVs only differ by the cost of the initial investment
+    first_prices = df_prices.iloc[0].to_numpy()
+    initial_investment = np.floor(1e6 / len(first_prices) / first_prices) @ first_prices
+    assert nav_without_costs[0] - nav_with_costs[0] == pytest.approx(initial_investment * 10 / 10_000)
+
+
+def test_strategy_with_signals_only_runs_on_the_portfolio(df_prices):
+    class FirstTickerStrategy(Strategy):
+        def generate_signals(self, data_for_signal_generation: dict):
+            return {ticker: float(i == 0) for i, ticker in enumerate(data_for_signal_generation)}
+
+    portfolio = _default_portfolio(df_prices)
+    portfolio.strategy = FirstTickerStrategy()
+    portfolio.rebalance_portfolio(df_prices.index[-1])
+    assert [position.weight for position in portfolio.positions] == [1.0, 0.0, 0.0, 0.0, 0.0]
+    with pytest.raises(NotImplementedError):
+        VectorizedBacktest(PricePanel.from_dataframe(df_prices)).run(FirstTickerStrategy())
+
+
+def test_backtest_restores_the_instruments(df_prices):
+    portfolio = _default_portfolio(df_prices)
+    instrument = portfolio.positions[0].instrument
+    last_quote, history = instrument.last_quote, [Quote(df_prices.index[0], 1.0)]
+    instrument.quote_history = history
+
+    BacktestEngine(portfolio, PricePanel.from_dataframe(df_prices), RebalancingCalendar('W')).run()
+    assert instrument.last_quote is last_quote and instrument.quote_history is history
+    assert instrument.quote_store is None
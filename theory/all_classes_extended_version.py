@@ -311,6 +311,9 @@ instrument. They also contain respective financial computation methods.
 """
 
 
+from bond_yield import calculate_bond_ytm
+
+
 # Base Class
 class FinancialAsset:
     def __init__(self, symbol, price):
@@ -325,8 +328,9 @@ class Bond(FinancialAsset):
         self.face_value = face_value
         self.maturity_date = maturity_date
 
-    def calculate_ytm(self):
-        pass  # Implement YTM calculation logic here
+    def calculate_ytm(self, settlement_date=None):
+        return calculate_bond_ytm(self.price, self.face_value, self.maturity_date,
+                                  settlement_date=settlement_date)
 
 
 # Derived Class
@@ -612,8 +616,9 @@ class CreditBond(FinancialInstrument):
         self.face_value = face_value
         self.maturity_date = maturity_date
 
-    def calculate_ytm(self):
-        pass  # Implement YTM calculation logic here
+    def calculate_ytm(self, settlement_date=None):
+        return calculate_bond_ytm(self.price, self.face_value, self.maturity_date,
+                                  settlement_date=settlement_date)
 
     def get_description(self):
         print(f'The ticker for this bond is {self.ticker} and its price is {round(self.price, 2)}. '
@@ -924,6 +929,84 @@ signal_series = strategy.generate_signals(price_data)
 print(signal_series)
 
 
+"""
+Example : a faster implementation of the MeanReversionStrategy
+The generate_signals method above rebuilds the list of the past t prices and sums it for every date: the cost is
+(number of dates x window). As the window slides by one date at a time, we only need to add the price entering the
+window and subtract the price leaving it: the cost becomes proportional to the number of dates only. Each addition and
+subtraction rounds the sum a little, so it is summed again from the window prices every `window` dates (the rounding
+errors cannot build up), and when a price is closer to the rolling mean than these errors, the window is summed as in
+MeanReversionStrategy: the signals are exactly the same.
+The same idea gives a streaming version: the update method receives one new price and returns its signal immediately,
+using a deque to remember the prices of the current window.
+"""
+
+import sys
+from collections import deque
+
+
+class MeanReversionStrategyRollingWindow(MeanReversionStrategy):
+
+    def __init__(self, mean_reversion_window):
+        super().__init__(mean_reversion_window)
+        self._window_prices = deque()
+        self._window_sum = 0
+        self._magnitude = 0  # largest price added to or removed from the sum since it was last summed again
+        self._update_count = 0
+
+    def _rounding_tolerance(self, magnitude):
+        """Bound of the difference between the rolling mean and the mean of the window summed again."""
+        return 4 * self.mean_reversion_window * sys.float_info.epsilon * magnitude
+
+    def generate_signals(self, price_series_for_mean_reverion_strategy):
+        dates = list(price_series_for_mean_reverion_strategy.keys())
+        prices = list(price_series_for_mean_reverion_strategy.values())
+        window = self.mean_reversion_window
+        signals = {}
+
+        window_sum = sum(prices[:window])
+        magnitude = max(map(abs, prices[:window]), default=0)
+        for i in range(window, len(prices)):
+            mean_price = window_sum / window
+            if abs(prices[i] - mean_price) <= self._rounding_tolerance(magnitude):
+                mean_price = sum(prices[i - window:i]) / window  # too close to call with the rolling sum
+            signals[dates[i]] = self._determine_signal(prices[i], mean_price)
+            window_sum += prices[i] - prices[i - window]
+            magnitude = max(magnitude, abs(prices[i]), abs(prices[i - window]))
+            if (i + 1) % window == 0:  # summed again so that the rounding errors do not build up
+                window_sum = sum(prices[i + 1 - window:i + 1])
+                magnitude = max(map(abs, prices[i + 1 - window:i + 1]))
+        return signals
+
+    def update(self, price):
+        """Adds a new price to the stream and returns its signal (None while the window is not complete)."""
+        signal = None
+        if len(self._window_prices) == self.mean_reversion_window:
+            mean_price = self._window_sum / self.mean_reversion_window
+            if abs(price - mean_price) <= self._rounding_tolerance(self._magnitude):
+                mean_price = sum(self._window_prices) / self.mean_reversion_window
+            signal = self._determine_signal(price, mean_price)
+            oldest_price = self._window_prices.popleft()
+            self._window_sum -= oldest_price
+            self._magnitude = max(self._magnitude, abs(oldest_price))
+        self._window_prices.append(price)
+        self._window_sum += price
+        self._magnitude = max(self._magnitude, abs(price))
+        self._update_count += 1
+        if self._update_count % self.mean_reversion_window == 0:  # summed again so that the errors do not build up
+            self._window_sum = sum(self._window_prices)
+            self._magnitude = max(map(abs, self._window_prices))
+        return signal
+
+
+fast_strategy = MeanReversionStrategyRollingWindow(mean_reversion_window=3)
+print(fast_strategy.generate_signals(price_data) == signal_series)  # True
+
+streaming_strategy = MeanReversionStrategyRollingWindow(mean_reversion_window=3)
+for date, price in price_data.items():
+    print(date, streaming_strategy.update(price))  # None for the first 3 dates, then the same signals as above
+
+
 """
 # Protocol in Python
 
@@ -0,0 +1,31 @@
+import math
+from datetime import date
+
+"""
+Yield to maturity of the Bond examples of the theory files (s1.py and all_classes_extended_version.py), kept in its own
+module so that the names rebound by the examples of these scripts (e.g. `date`) cannot shadow the ones it uses.
+"""
+
+
+def calculate_bond_ytm(price, face_value, maturity_date, coupon_rate=0.0, settlement_date=None, tolerance=1e-10):
+    """
+    Yield to maturity (annual compounding) by Newton's method: the yield y such that the price (in the same currency
+    units as face_value) equals the annual coupons coupon_rate x face_value and the face_value at maturity, discounted
+    at (1 + y) ** -years. Returns NaN for a bond already matured on settlement_date (today by default).
+    """
+    settlement = date.fromisoformat(str(settlement_date)[:10]) if settlement_date is not None else date.today()
+    years = (date.fromisoformat(str(maturity_date)[:10]) - settlement).days / 365.25
+    if years <= 0:
+        return float('nan')
+    times = [years - k for k in range(math.ceil(years))]  # one coupon per year, counted back from the maturity
+    cashflows = [coupon_rate * face_value] * len(times)
+    cashflows[0] += face_value
+    ytm = (sum(cashflows) / price) ** (1 / years) - 1
+    for _ in range(100):
+        error = sum(cashflow * (1 + ytm) ** -time for cashflow, time in zip(cashflows, times)) - price
+        derivative = -sum(time * cashflow * (1 + ytm) ** (-time - 1) for cashflow, time in zip(cashflows, times))
+        step = error / derivative
+        ytm = max(ytm - step, (ytm - 1) / 2)  # stays above -100%
+        if abs(step) < tolerance:
+            break
+    return ytm
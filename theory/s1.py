@@ -202,6 +202,9 @@ It also contain its own methods.
 """
 
 
+from bond_yield import calculate_bond_ytm
+
+
 # Base Class
 class FinancialAsset:
     def __init__(self, symbol, price):
@@ -216,8 +219,9 @@ class Bond(FinancialAsset):
         self.face_value = face_value
         self.maturity_date = maturity_date
 
-    def calculate_ytm(self):
-        pass  # Implement YTM calculation logic here
+    def calculate_ytm(self, settlement_date=None):
+        return calculate_bond_ytm(self.price, self.face_value, self.maturity_date,
+                                  settlement_date=settlement_date)
 
 
 asset = FinancialAsset("USD", "1.0")  # create financial asset object
@@ -190,6 +190,100 @@ The key point is that after the first access, the LazyProperty descriptor is eff
 This is why the “Loading data…” message only appears once.
 """
 
+"""
+Going further: LazyProperty for large files
+DataProcessor.data reads the whole file in memory on first access, which is not possible for multi-GB trade logs or
+tick files. The StreamingDataProcessor below keeps the same lazy style but:
+    - memory_map maps the file in memory on first access. The operating system only loads the pages we read.
+    - record_offsets computes (once) the position of the beginning of each line. Reading record N is then a direct
+      access, whatever the size of the file. The index can be saved next to the file to avoid computing it again.
+    - iter_chunks yields the parsed records by chunks, without ever holding the whole file.
+"""
+
+import mmap
+import os
+
+import numpy as np
+
+
+class StreamingDataProcessor:
+    def __init__(self, filename, parser=None, chunk_size=10_000, index_filename=None, block_size=2 ** 24):
+        self.filename = filename
+        self.parser = parser if parser is not None else lambda line: line.decode('utf-8')
+        self.chunk_size = chunk_size
+        self.index_filename = index_filename
+        self.block_size = block_size  # bytes scanned at once when indexing
+
+    @LazyProperty
+    def memory_map(self):
+        print("Mapping data...")
+        if os.path.getsize(self.filename) == 0:
+            return b''  # an empty file cannot be memory-mapped
+        with open(self.filename, 'rb') as f:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    @LazyProperty
+    def record_offsets(self):
+        if self.index_filename is not None and os.path.exists(self.index_filename) \
+                and os.path.getmtime(self.index_filename) >= os.path.getmtime(self.filename):
+            return np.load(self.index_filename, mmap_mode='r')
+
+        print("Indexing data...")
+        # the new lines are searched block by block, so only one block of the file is compared at a time
+        size = len(self.memory_map)
+        new_lines = [np.zeros(0, dtype=np.int64)]
+        for block_start in range(0, size, self.block_size):
+            block = np.frombuffer(self.memory_map, dtype=np.uint8, count=min(self.block_size, size - block_start),
+                                  offset=block_start)
+            new_lines.append(np.flatnonzero(block == ord('\n')) + block_start)
+        offsets = np.concatenate(([0], *[positions + 1 for positions in new_lines], [size])).astype(np.int64)
+        if offsets[-2] == offsets[-1]:  # the file ends with a new line (or is empty)
+            offsets = offsets[:-1]
+        if self.index_filename is not None:
+            np.save(self.index_filename, offsets)
+        return offsets
+
+    def __len__(self):
+        return len(self.record_offsets) - 1
+
+    def __getitem__(self, n):
+        if n < 0:
+            n += len(self)
+        if not 0 <= n < len(self):
+            raise IndexError("record index out of range")
+        start, end = self.record_offsets[n], self.record_offsets[n + 1]
+        return self.parser(self.memory_map[start:end].rstrip(b'\r\n'))
+
+    def __iter__(self):
+        for chunk in self.iter_chunks():
+            yield from chunk
+
+    def iter_chunks(self):
+        """
+        Yields lists of at most chunk_size parsed records. Each line is sliced from its own position in the map (the
+        shared file position of the map is not used), so several iterations and random accesses can be mixed.
+        """
+        memory_map, size = self.memory_map, len(self.memory_map)
+        start = 0
+        chunk = []
+        while start < size:
+            end = memory_map.find(b'\n', start)
+            end = size if end == -1 else end + 1
+            chunk.append(self.parser(memory_map[start:end].rstrip(b'\r\n')))
+            start = end
+            if len(chunk) == self.chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+
+
+streaming_processor = StreamingDataProcessor('insert the path of your project here/Built-in error in python.txt')
+print(len(streaming_processor))  # Prints "Indexing data...", "Mapping data..." and the number of lines
+print(streaming_processor[3])  # Reads the fourth line only
+for lines in streaming_processor.iter_chunks():
+    print(len(lines))
+
 """
 ## Creational Design Patterns in Python
 Creational design patterns provide various object creation mechanisms, which increase flexibility and reuse of existing